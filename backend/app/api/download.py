@@ -1,47 +1,65 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.core.job_store import job_store
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
+from app.core.job_store import job_store, FINISHED_JOB_STATUSES
 from app.services.s3_client import s3_client, BUCKET_NAME
 from worker.tasks.ffmpeg import RESOLUTIONS
 import logging
 import os
-from fastapi.responses import RedirectResponse
-from app.services.s3_service import generate_presigned_download_url
+from fastapi.responses import RedirectResponse, Response
+from botocore.exceptions import ClientError
+from app.services.presign_cache import presigned_url_cache
+from worker.tasks.packaging import hls_prefix, master_playlist_key
+
+HLS_MEDIA_TYPE = "application/vnd.apple.mpegurl"
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Create resolution-specific filename for download
+def _download_filename(job, res_key: str) -> str:
+    base_name = os.path.splitext(job.original_filename)[0]
+    return f"{base_name}_{res_key}.mp4"
+
+
 # Route and function to get the processed file
 @router.get("/download/{job_id}/{res_key}")
-async def download_video(job_id:str,res_key:str,db:Session = Depends(get_db)):
+async def download_video(job_id:str,res_key:str,db:AsyncSession = Depends(get_async_db)):
     try:
         if res_key not in RESOLUTIONS:
             raise HTTPException(
                 status_code=404,
                 detail=f"Invalid resolution. Available:{list(RESOLUTIONS.keys())}"
             )
-        job = job_store.get_job(db,job_id)
+        job = await job_store.aget_job_record(db,job_id)
         if not job:
             raise HTTPException(status_code=404,detail="Job not found in the database")
         
-        object_name = f"output/{job_id}_{res_key}.mp4"
-        try:
-            s3_client.head_object(Bucket=BUCKET_NAME, Key=object_name)
-        except Exception as e:
-            logger.error(f"{object_name} not found.. {e}")
-            raise HTTPException(status_code=404, detail="File processing or missing")
-        
-        # Create resolution-specific filename for download
-        base_name = os.path.splitext(job.original_filename)[0]
-        download_filename = f"{base_name}_{res_key}.mp4"
-        
+        rendition = job.renditions.get(res_key)
+        if (not rendition or rendition["status"] != "COMPLETED") and job.status not in FINISHED_JOB_STATUSES:
+            # The cached record may predate the worker finishing this rendition
+            job = await job_store.aget_job_record(db,job_id,fresh=True)
+            rendition = job.renditions.get(res_key)
+
+        if not job.renditions and job.status in FINISHED_JOB_STATUSES:
+            # Jobs finished before the renditions table existed: fall back to asking S3
+            object_name = f"output/{job_id}_{res_key}.mp4"
+            if not await presigned_url_cache.get_cached_url(object_name, _download_filename(job, res_key)):
+                try:
+                    await run_in_threadpool(s3_client.head_object, Bucket=BUCKET_NAME, Key=object_name)
+                except Exception as e:
+                    logger.error(f"{object_name} not found.. {e}")
+                    raise HTTPException(status_code=404, detail="File processing or missing")
+        elif not rendition or rendition["status"] != "COMPLETED":
+            # Renditions are served as soon as they finish; point the client at the ones it can play already
+            available = [res for res,data in job.renditions.items() if data["status"] == "COMPLETED"]
+            raise HTTPException(status_code=404, detail=f"File processing or missing. Available:{available}")
+        else:
+            object_name = rendition["object_name"]
+
         # Temporary download URL signed for the external environment
-        download_url = generate_presigned_download_url(
-            object_name=object_name,
-            filename=download_filename,
-            expiration=3600
-        )
+        download_url = await presigned_url_cache.get_url(object_name, _download_filename(job, res_key))
 
         return RedirectResponse(url=download_url)
     except HTTPException:raise
@@ -49,3 +67,50 @@ async def download_video(job_id:str,res_key:str,db:Session = Depends(get_db)):
     except Exception as e:
         logger.error(f"Download failed for {job_id}:{e}")
         raise HTTPException(status_code=500,detail="Internal Server Error")
+
+
+
+# Blocking S3 read, called from the routes through run_in_threadpool
+def _read_playlist(object_name: str) -> str:
+    try:
+        return s3_client.get_object(Bucket=BUCKET_NAME, Key=object_name)["Body"].read().decode()
+    except ClientError as e:
+        logger.error(f"{object_name} not found.. {e}")
+        raise HTTPException(status_code=404, detail="Playlist processing or missing")
+
+
+# HLS master playlist of a job. Variant URIs are relative, so players resolve them to the variant route below.
+@router.get("/download/{job_id}/hls/master.m3u8")
+async def get_master_playlist(job_id:str,db:AsyncSession = Depends(get_async_db)):
+    job = await job_store.aget_job_record(db,job_id)
+    if not job:
+        raise HTTPException(status_code=404,detail="Job not found in the database")
+
+    return Response(content=await run_in_threadpool(_read_playlist, master_playlist_key(job_id)), media_type=HLS_MEDIA_TYPE)
+
+
+# HLS media playlist of one rendition. Segments (and the fMP4 init segment) are private in S3,
+# so every URI is rewritten to a presigned GET URL.
+@router.get("/download/{job_id}/hls/{res_key}/playlist.m3u8")
+async def get_variant_playlist(job_id:str,res_key:str,db:AsyncSession = Depends(get_async_db)):
+    if res_key not in RESOLUTIONS:
+        raise HTTPException(status_code=404,detail=f"Invalid resolution. Available:{list(RESOLUTIONS.keys())}")
+    job = await job_store.aget_job_record(db,job_id)
+    if not job:
+        raise HTTPException(status_code=404,detail="Job not found in the database")
+
+    prefix = f"{hls_prefix(job_id)}{res_key}/"
+    lines = (await run_in_threadpool(_read_playlist, f"{prefix}playlist.m3u8")).splitlines()
+
+    # Collect every segment URI first so all of them are signed (or found in the cache) in one batch
+    uris = {}
+    for i, line in enumerate(lines):
+        if line.startswith("#EXT-X-MAP:") and 'URI="' in line:
+            uris[i] = line.split('URI="', 1)[1].split('"', 1)[0]
+        elif line and not line.startswith("#"):
+            uris[i] = line
+    urls = await presigned_url_cache.get_urls([(prefix + uri, None) for uri in uris.values()])
+    for (i, uri), url in zip(uris.items(), urls):
+        lines[i] = lines[i].replace(uri, url) if lines[i].startswith("#") else url
+
+    return Response(content="\n".join(lines) + "\n", media_type=HLS_MEDIA_TYPE)
@@ -1,71 +1,113 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from celery.result import AsyncResult
 from app.core.celery_app import celery_app
-from app.services.s3_service import generate_presigned_download_url
+from app.services.presign_cache import presigned_url_cache
+from app.services.estimator import encode_estimator
 from datetime import timedelta
-from app.db.database import get_db
-from app.core.job_store import job_store
+from app.db.database import get_async_db, get_async_sessionmaker
+from app.core.job_store import job_store, FINISHED_JOB_STATUSES
 from app.core.limiter import limiter
+from app.core.progress_store import progress_store, FINAL_STATES
+from app.core.redis_client import get_async_redis
+import json
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Comment line sent while nothing changes so proxies keep the connection open
+KEEPALIVE_INTERVAL = 15
+
+# Celery states that mean the job will not publish anything anymore
+FINISHED_TASK_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+
+# Download URL of every COMPLETED rendition. presigned URL is used to create a temporary URL for the output file
+# stored in S3 to download the file. The same URL is reused across polls until it gets close to expiring.
+async def _download_urls(job, renditions: dict) -> dict:
+    downloads = {}
+    completed = [res for res,rendition in renditions.items() if rendition["status"] == "COMPLETED"]
+    objects = [(renditions[res]["object_name"], f"{job.original_filename}_{res}.mp4") for res in completed]
+    for res, (object_name, _), presigned_url in zip(completed, objects, await presigned_url_cache.get_urls(objects)):
+        if presigned_url:
+            downloads[res] = presigned_url
+        else:
+            logger.error(f"Failed to generate URL for {object_name}")
+    return downloads
+
+
+# State and result (or progress meta) of a job's Celery task. Every read is a blocking round trip to the
+# result backend, so the routes call this in the threadpool.
+def _task_state(task_id: str):
+    result = AsyncResult(task_id,app=celery_app)
+    return result.state, result.info
+
+
 # Endpoint to check the status of the desired task with the help of task id which is being generated at the time of file upload
 @router.get("/tasks/{task_id}/status")
 @limiter.limit("60/minute")
-async def get_status(request: Request, task_id: str, db: Session = Depends(get_db)):
+async def get_status(request: Request, task_id: str, db: AsyncSession = Depends(get_async_db)):
 
     try:
-        job = job_store.get_job(db,task_id)
+        job = await job_store.aget_job_record(db,task_id)
         if not job:
             raise HTTPException(status_code=404,detail="Job not found in the database")
         # This is checking for the status of the task by connecting the backend to the redis
-        result  = AsyncResult(task_id,app=celery_app)
+        state, info = await run_in_threadpool(_task_state, task_id)
 
-        if result.state == "PROGRESS":
-            progress_data = result.info if isinstance(result.info,dict) else {}
-            tasks = progress_data.get("tasks",{})
+        if state == "PROGRESS":
+            progress_data = info if isinstance(info,dict) else {}
+            # Fan-out subtasks report per rendition in the progress store, single-task jobs in the task meta
+            tasks = await progress_store.aget_all(task_id) or progress_data.get("tasks",{})
 
-            # Gets the percent complete for the keys present in the RESOLUTIONS which are the original resolutions
-            active_progress_values = [ data.get("progress",0) for data in tasks.values()]
-            overall_progress = sum(active_progress_values)/ len(active_progress_values) if active_progress_values else 0
+            # Renditions weigh by their predicted encode time; without a probed source every rendition counts the same
+            estimate = encode_estimator.progress(job.source_info, await encode_estimator.arates(db), tasks, job.ladder)
+            if estimate and estimate["overall_progress"] is not None:
+                overall_progress = estimate["overall_progress"]
+            else:
+                active_progress_values = [ data.get("progress",0) for data in tasks.values()]
+                overall_progress = sum(active_progress_values)/ len(active_progress_values) if active_progress_values else 0
 
             return{
                 "task_id":task_id,
                 "state":"Processing",
                 "overall_progress":int(overall_progress),
+                # Seconds until the last rendition is expected, from the encode history and the live encode speed
+                "eta_seconds":estimate["eta_seconds"] if estimate else None,
+                # Renditions are served as soon as they are uploaded (the worker drops the cached record each time)
+                "download_urls":await _download_urls(job, job.renditions or {}),
                 "details":tasks,
                 "filename":job.original_filename
             }
 
-        elif result.state == "SUCCESS":
-            downloads = {}
+        elif state == "SUCCESS":
             details = {}
-            for res in job.resolutions:
-                object_name = f"output/{task_id}_{res}.mp4"
-                details[res] = {"status": "COMPLETED"}
-                try:
-                    # presigned URL is used to create a temporary URL for the output file stored in S3 to download the file
-                    presigned_url = generate_presigned_download_url(
-                        object_name=object_name,
-                        filename=f"{job.original_filename}_{res}.mp4",
-                        expiration=3600
-                        )
-                    downloads[res] = presigned_url
-                except Exception as e:
-                    logger.error(f"Failed to generate URL for {object_name}:{e}")
+            task_result = info if isinstance(info,dict) else {}
+            # The record may have been cached while the worker was still finishing renditions
+            if job.status not in FINISHED_JOB_STATUSES:
+                job = await job_store.aget_job_record(db,task_id,fresh=True)
+
+            # Jobs finished before the renditions table existed have no rows; their ladder is assumed complete
+            renditions = job.renditions or {
+                res: {"status":"COMPLETED","object_name":f"output/{task_id}_{res}.mp4"} for res in job.resolutions
+            }
+            downloads = await _download_urls(job, renditions)
+            for res,rendition in renditions.items():
+                details[res] = {key:value for key,value in rendition.items() if key != "object_name"}
 
             return {
                 "task_id":task_id,
                 "state":"COMPLETED",
                 "overall_progress":100,
                 "download_urls":downloads,
+                # Adaptive-bitrate playback entry point, only present when the job was packaged as HLS
+                "master_playlist_url":str(request.url_for("get_master_playlist",job_id=task_id)) if task_result.get("master_playlist") else None,
                 "details": details,
                 "filename":job.original_filename
             }
-        elif result.state == "FAILURE":
+        elif state == "FAILURE":
             return {
                 "task_id":task_id,
                 "state":"Failed",
@@ -73,10 +115,13 @@ async def get_status(request: Request, task_id: str, db: Session = Depends(get_d
                 "error":"Processing failed, please try again.",
             }
 
+        # Predicted encode time once a worker picks the job up (time spent in the queue is not included)
+        prediction = encode_estimator.predict(job.source_info, await encode_estimator.arates(db), job.ladder)
         return {
             "task_id":task_id,
             "state":"Queued",
             "overall_progress":0,
+            "eta_seconds":prediction["eta_seconds"] if prediction else None,
             "filename":job.original_filename
         }
     
@@ -85,4 +130,56 @@ async def get_status(request: Request, task_id: str, db: Session = Depends(get_d
     
     except Exception as e:
         logger.error(f"api error:{e}")
-        raise HTTPException(status_code=500,detail="Internal Server Error")
\ No newline at end of file
+        raise HTTPException(status_code=500,detail="Internal Server Error")
+
+
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# Server-Sent Events stream of a job's progress. Sends a snapshot first, then every delta the worker
+# publishes, and closes after the final state. A rendition whose status turns COMPLETED can be downloaded
+# right away; clients fetch /status for its URL (or use the download route).
+@router.get("/tasks/{task_id}/events")
+@limiter.limit("30/minute")
+async def stream_status(request: Request, task_id: str):
+    # A short-lived session rather than get_async_db: request-scoped dependencies are only closed once the
+    # stream ends, which would hold a pooled connection for as long as the client stays connected
+    async with get_async_sessionmaker()() as db:
+        job = await job_store.aget_job_record(db,task_id)
+    if not job:
+        raise HTTPException(status_code=404,detail="Job not found in the database")
+
+    async def event_stream():
+        redis = get_async_redis()
+        channel = progress_store.channel(task_id)
+        pubsub = redis.pubsub()
+        # Subscribe before reading the snapshot so no delta published in between is lost
+        await pubsub.subscribe(channel)
+        try:
+            tasks = await progress_store.aget_all(task_id)
+            state, _ = await run_in_threadpool(_task_state, task_id)
+            yield _sse({"type":"snapshot","state":state,"tasks":tasks}, "snapshot")
+            if state in FINISHED_TASK_STATES:
+                return
+
+            while not await request.is_disconnected():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_INTERVAL)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                data = json.loads(message["data"])
+                yield _sse(data, data.get("type"))
+                if data.get("type") == "state" and data.get("state") in FINAL_STATES:
+                    return
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"}
+    )
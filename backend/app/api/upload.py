@@ -1,20 +1,42 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, validator
-from app.db.database import get_db
+from typing import List
+from botocore.exceptions import ClientError
+from app.db.database import get_async_db
 from app.core.job_store import job_store
-from app.services.s3_service import generate_presigned_upload_url
+from app.core.config import MAX_UPLOAD_SIZE, MULTIPART_PART_SIZE, PROBE_TIMEOUT
+from app.services.s3_service import (
+    generate_presigned_upload_url,
+    create_multipart_upload,
+    generate_presigned_part_urls,
+    list_uploaded_parts,
+    complete_multipart_upload,
+    abort_multipart_upload,
+    generate_presigned_get_url,
+)
 from app.services.queue_service import enqueue_transcode_task
+from app.services.scheduler import estimate_cost, choose_queue
+from app.services.estimator import encode_estimator
+from fastapi.concurrency import run_in_threadpool
+from worker.tasks.ladder import probe_source, build_ladder
 from worker.tasks.ffmpeg import RESOLUTIONS
 from app.core.limiter import limiter
 import uuid
+import math
 import os
+import logging
 
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 allowed_extensions = {".mp4",".mkv",".mov"}
-MAX_FILE_SIZE = 2 * 1024 * 1024  # 2MB limit
+MAX_FILE_SIZE = MAX_UPLOAD_SIZE
+
+# S3 limits for multipart uploads
+MAX_PARTS = 10000
+MAX_SIGN_BATCH = 1000
 
 class UploadRequest(BaseModel):
     filename:str
@@ -36,16 +58,53 @@ class UploadRequest(BaseModel):
         if '..' in v or '/' in v or '\\' in v:
             raise ValueError("Invalid characters in filename")
         return v
-        
+
+
+class SignPartsRequest(BaseModel):
+    upload_id:str
+    part_numbers:List[int]
+
+    @validator('part_numbers')
+    def validate_part_numbers(cls, v):
+        if not v or len(v) > MAX_SIGN_BATCH:
+            raise ValueError(f"Between 1 and {MAX_SIGN_BATCH} part numbers per request")
+        if any(n < 1 or n > MAX_PARTS for n in v):
+            raise ValueError(f"Part numbers must be between 1 and {MAX_PARTS}")
+        return v
+
+
+class UploadedPart(BaseModel):
+    part_number:int
+    etag:str
+
+
+class CompleteUploadRequest(BaseModel):
+    upload_id:str
+    parts:List[UploadedPart]
+
+
+class AbortUploadRequest(BaseModel):
+    upload_id:str
+
+
+def validate_extension(filename: str):
+    _,ext = os.path.splitext(filename)
+    if ext.lower() not in allowed_extensions:
+        raise HTTPException(status_code=400,detail="Unsupported file type")
+
+
+# Smallest part size >= MULTIPART_PART_SIZE that keeps the upload within S3's part limit
+def multipart_part_size(filesize: int) -> int:
+    return max(MULTIPART_PART_SIZE, math.ceil(filesize / MAX_PARTS))
+
+
 @router.post("/upload")
 @limiter.limit("10/minute")
-async def upload_file(request: Request, upload_request: UploadRequest, db: Session = Depends(get_db)):
+async def upload_file(request: Request, upload_request: UploadRequest, db: AsyncSession = Depends(get_async_db)):
     # Basic validation for file is being done at this step
     if not upload_request.filename:
         raise HTTPException(status_code=400,detail="No file uploaded")
-    _,ext = os.path.splitext(upload_request.filename)
-    if ext.lower() not in allowed_extensions:
-        raise HTTPException(status_code=400,detail="Unsupported file type")
+    validate_extension(upload_request.filename)
     
     # job id for the transcoding task is being generated over here
     job_id = str(uuid.uuid4())
@@ -61,12 +120,13 @@ async def upload_file(request: Request, upload_request: UploadRequest, db: Sessi
     
     # Storing the file details in the database
     resolutions_to_process = list(RESOLUTIONS.keys())
-    job_store.create_job(
+    await job_store.acreate_job(
         db = db,
         job_id = job_id,
         original_filename=upload_request.filename,
         input_object_name=object_name,
-        resolutions=resolutions_to_process
+        resolutions=resolutions_to_process,
+        upload_size=upload_request.filesize
     )
 
     # returning the task id to the user
@@ -77,20 +137,156 @@ async def upload_file(request: Request, upload_request: UploadRequest, db: Sessi
         "upload_url":upload_url
     }
 
+# Multipart upload: initiate -> sign parts (PUT them concurrently) -> complete, or abort.
+# The parts endpoint lets a client that lost its connection find out which parts S3 already has.
+# S3 calls block (completing a large upload can take seconds), so they run in the threadpool; signing is local.
+@router.post("/upload/multipart/initiate")
+@limiter.limit("10/minute")
+async def initiate_multipart_upload(request: Request, upload_request: UploadRequest, db: AsyncSession = Depends(get_async_db)):
+    validate_extension(upload_request.filename)
+
+    job_id = str(uuid.uuid4())
+    object_name = f"input/{job_id}_{upload_request.filename}"
+
+    try:
+        upload_id = await run_in_threadpool(create_multipart_upload, object_name)
+    except ClientError as e:
+        logger.error(f"Could not start multipart upload for {object_name}: {e}")
+        raise HTTPException(status_code=500,detail="Multipart upload not started")
+
+    await job_store.acreate_job(
+        db = db,
+        job_id = job_id,
+        original_filename=upload_request.filename,
+        input_object_name=object_name,
+        resolutions=list(RESOLUTIONS.keys()),
+        upload_size=upload_request.filesize
+    )
+
+    part_size = multipart_part_size(upload_request.filesize)
+    return {
+        "task_id":job_id,
+        "status":"queued",
+        "filename":upload_request.filename,
+        "upload_id":upload_id,
+        "part_size":part_size,
+        "part_count":math.ceil(upload_request.filesize / part_size)
+    }
+
+
+async def _get_upload_job(db: AsyncSession, job_id: str):
+    job = await job_store.aget_job_record(db,job_id)
+    if not job:
+        raise HTTPException(status_code=404,detail="Job not found")
+    return job
+
+
+# Parts the declared upload size was split into at initiate (jobs created before the size was stored allow all)
+def upload_part_count(job) -> int:
+    if not job.upload_size:
+        return MAX_PARTS
+    return math.ceil(job.upload_size / multipart_part_size(job.upload_size))
+
+
+@router.post("/upload/multipart/{job_id}/sign")
+@limiter.limit("120/minute")
+async def sign_upload_parts(request: Request, job_id: str, sign_request: SignPartsRequest, db: AsyncSession = Depends(get_async_db)):
+    job = await _get_upload_job(db,job_id)
+    part_count = upload_part_count(job)
+    if any(n > part_count for n in sign_request.part_numbers):
+        raise HTTPException(status_code=400,detail=f"Part numbers must be between 1 and {part_count}")
+    urls = generate_presigned_part_urls(job.input_object_name, sign_request.upload_id, sign_request.part_numbers)
+    return {"task_id":job_id,"urls":urls}
+
+
+@router.get("/upload/multipart/{job_id}/parts")
+@limiter.limit("60/minute")
+async def get_uploaded_parts(request: Request, job_id: str, upload_id: str, db: AsyncSession = Depends(get_async_db)):
+    job = await _get_upload_job(db,job_id)
+    try:
+        parts = await run_in_threadpool(list_uploaded_parts, job.input_object_name, upload_id)
+    except ClientError as e:
+        logger.error(f"Could not list parts of {job.input_object_name}: {e}")
+        raise HTTPException(status_code=404,detail="Upload not found")
+    return {"task_id":job_id,"parts":parts}
+
+
+@router.post("/upload/multipart/{job_id}/complete")
+@limiter.limit("10/minute")
+async def complete_upload(request: Request, job_id: str, complete_request: CompleteUploadRequest, db: AsyncSession = Depends(get_async_db)):
+    job = await _get_upload_job(db,job_id)
+    parts = sorted((part.dict() for part in complete_request.parts), key=lambda part: part["part_number"])
+
+    # The parts were PUT straight to S3, so their size is only known now: an upload larger than it was
+    # declared (or than MAX_UPLOAD_SIZE) is aborted instead of assembled
+    try:
+        listed = await run_in_threadpool(list_uploaded_parts, job.input_object_name, complete_request.upload_id)
+        uploaded = {part["part_number"]: part["size"] for part in listed}
+    except ClientError as e:
+        logger.error(f"Could not list parts of {job.input_object_name}: {e}")
+        raise HTTPException(status_code=404,detail="Upload not found")
+    size = sum(uploaded.get(part["part_number"], 0) for part in parts)
+    if size > min(job.upload_size or MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE):
+        logger.warning(f"Upload of {job.input_object_name} is {size} bytes, {job.upload_size} were declared; aborting")
+        try:
+            await run_in_threadpool(abort_multipart_upload, job.input_object_name, complete_request.upload_id)
+        except ClientError as e:
+            logger.error(f"Could not abort multipart upload of {job.input_object_name}: {e}")
+        await job_store.aupdate_job_status(db,job_id,status="FAILED",is_completed=True)
+        raise HTTPException(status_code=400,detail="Upload is larger than declared")
+
+    try:
+        await run_in_threadpool(complete_multipart_upload, job.input_object_name, complete_request.upload_id, parts)
+    except ClientError as e:
+        logger.error(f"Could not complete multipart upload of {job.input_object_name}: {e}")
+        raise HTTPException(status_code=400,detail="Upload could not be completed")
+    return {"task_id":job_id,"status":"uploaded"}
+
+
+@router.post("/upload/multipart/{job_id}/abort")
+@limiter.limit("10/minute")
+async def abort_upload(request: Request, job_id: str, abort_request: AbortUploadRequest, db: AsyncSession = Depends(get_async_db)):
+    job = await _get_upload_job(db,job_id)
+    try:
+        await run_in_threadpool(abort_multipart_upload, job.input_object_name, abort_request.upload_id)
+    except ClientError as e:
+        logger.error(f"Could not abort multipart upload of {job.input_object_name}: {e}")
+        raise HTTPException(status_code=404,detail="Upload not found")
+    await job_store.aupdate_job_status(db,job_id,status="FAILED",is_completed=True)
+    return {"task_id":job_id,"status":"aborted"}
+
+
 @router.post("/process/{job_id}")
-async def start_processing(job_id:str,db:Session=Depends(get_db)):
+async def start_processing(job_id:str,db:AsyncSession=Depends(get_async_db)):
 
-    job = job_store.get_job(db,job_id)
+    job = await job_store.aget_job_record(db,job_id)
     if not job:
         raise HTTPException(status_code=404,detail="Job not found")
-    
+
+    # Probe the uploaded source (through a presigned URL, only the headers are read) to estimate the job's cost.
+    # The worker reuses the stored analysis instead of probing again. A probe that stalls on S3 gives up after
+    # PROBE_TIMEOUT seconds; the job then goes to the long queue and the worker probes its local copy.
+    source_url = generate_presigned_get_url(job.input_object_name, expiration=300)
+    source_info = await run_in_threadpool(probe_source, source_url, PROBE_TIMEOUT) if source_url else None
+    ladder = build_ladder(source_info)
+    cost = estimate_cost(source_info, ladder)
+    queue = choose_queue(cost)
+    # Encode time predicted from the encode history, kept on the job for capacity planning
+    prediction = encode_estimator.predict(source_info, await encode_estimator.arates(db), ladder)
+    if source_info:
+        await job_store.aset_source_info(db,job_id,source_info,ladder,prediction["encode_seconds"] if prediction else None)
+    logger.info(f"Job {job_id} estimated at {cost} s of 1080p encoding ({prediction['encode_seconds'] if prediction else 'unknown'} s predicted), routed to {queue}")
+
     # Task is ready for the celery worker
-    enqueue_transcode_task(job_id,job.input_object_name)
+    await run_in_threadpool(enqueue_transcode_task, job_id, job.input_object_name, queue)
 
-    job_store.update_job_status(db,job_id,status="QUEUED")
+    await job_store.aupdate_job_status(db,job_id,status="QUEUED")
 
     return {
         "task_id":job_id,
         "status":"queued",
+        "queue":queue,
+        # Predicted encode_seconds, eta_seconds, per-rendition seconds and scheduler cost (None when the probe failed)
+        "prediction":prediction,
         "message": "Transcoding successfully queued"
     }
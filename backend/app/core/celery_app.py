@@ -1,5 +1,8 @@
 import os
 from celery import Celery
+from kombu import Exchange, Queue
+from app.core.config import TRANSCODE_QUEUE_SHORT, TRANSCODE_QUEUE_LONG, WORKER_PREFETCH_MULTIPLIER, WORKER_CONCURRENCY
+from worker.tasks.resources import default_concurrency
 
 # Celery configuration - uses REDIS_URL from environment (Railway/Redis Cloud)
 # Falls back to localhost for local development
@@ -18,7 +21,11 @@ celery_app = Celery(
     backend = REDIS_URL,
     include=[
         "worker.tasks.transcode",
+        "worker.tasks.fanout",
+        "worker.tasks.chunked",
         "worker.tasks.cleanup",
+        # Worker exporter and retry/failure counters (signal handlers only)
+        "worker.tasks.metrics",
     ]
 )
 
@@ -46,5 +53,19 @@ celery_app.conf.update(
 
     task_track_started=True,
     task_time_limit=30 * 60,
-    worker_concurrency=4,
+    # Sized from the node's CPUs and memory unless set; encodes share the CPUs through slots (worker.tasks.resources)
+    worker_concurrency=WORKER_CONCURRENCY or default_concurrency(),
+    worker_prefetch_multiplier=WORKER_PREFETCH_MULTIPLIER,
+
+    # Transcode tasks are acknowledged late (redelivered if their worker dies). Redis redelivers a message
+    # that was not acknowledged within the visibility timeout, so it has to outlast the task time limit.
+    broker_transport_options={"visibility_timeout": 2 * 60 * 60},
+
+    # Transcodes are routed to the short or long queue by estimated cost (app.services.scheduler).
+    # A worker without -Q consumes all of them; dedicated pools use -Q transcode_short / transcode_long.
+    task_default_queue="celery",
+    task_queues=tuple(
+        Queue(name, Exchange(name), routing_key=name)
+        for name in ("celery", TRANSCODE_QUEUE_SHORT, TRANSCODE_QUEUE_LONG)
+    ),
 )
\ No newline at end of file
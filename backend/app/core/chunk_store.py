@@ -0,0 +1,41 @@
+from app.core.redis_client import get_redis
+
+# Chunk state only matters while a job is being processed or retried
+CHUNK_TTL = 2 * 24 * 60 * 60
+
+class ChunkStore:
+    """Tracks which chunks of a chunked transcode are already encoded.
+
+    A retried chunk task (or a re-run of the whole job) checks here first,
+    so only the chunks that failed are encoded again.
+    """
+
+    def _key(self, job_id: str) -> str:
+        return f"chunks:{job_id}"
+
+    def _done_key(self, job_id: str) -> str:
+        return f"chunks:{job_id}:done_seconds"
+
+    def get_status(self, job_id: str, res_name: str, index: int):
+        return get_redis().hget(self._key(job_id), f"{res_name}:{index}")
+
+    # Marks a chunk as encoded and returns how many seconds of the rendition are done so far
+    def mark_completed(self, job_id: str, res_name: str, index: int, duration: float) -> float:
+        pipe = get_redis().pipeline()
+        pipe.hset(self._key(job_id), f"{res_name}:{index}", "COMPLETED")
+        pipe.hincrbyfloat(self._done_key(job_id), res_name, duration)
+        pipe.expire(self._key(job_id), CHUNK_TTL)
+        pipe.expire(self._done_key(job_id), CHUNK_TTL)
+        return float(pipe.execute()[1])
+
+    def mark_failed(self, job_id: str, res_name: str, index: int):
+        pipe = get_redis().pipeline()
+        pipe.hset(self._key(job_id), f"{res_name}:{index}", "FAILED")
+        pipe.expire(self._key(job_id), CHUNK_TTL)
+        pipe.execute()
+
+    def clear(self, job_id: str):
+        get_redis().delete(self._key(job_id), self._done_key(job_id))
+
+# A single instance which we can use globally
+chunk_store = ChunkStore()
@@ -0,0 +1,131 @@
+import os
+
+# How the worker encodes the ladder:
+#   single_pass  - decode the input once and fan out to every rendition in one ffmpeg run
+#   per_rendition - run ffmpeg once per rendition (also used as the fallback for single_pass)
+#   fanout       - one Celery subtask per rendition, finalized by a chord callback
+#   chunked      - split the input at keyframes and encode every chunk of every rendition as its own subtask
+TRANSCODE_MODE = os.getenv("TRANSCODE_MODE", "single_pass")
+
+# Target chunk length in seconds for the chunked mode (chunks are cut at the next keyframe)
+CHUNK_DURATION = int(os.getenv("CHUNK_DURATION", "120"))
+
+# Adaptive-bitrate packaging of the finished renditions:
+#   none - standalone MP4 per rendition only (output/{job_id}_{res}.mp4)
+#   hls  - additionally package every rendition as HLS under output/{job_id}/ with a master playlist
+ABR_PACKAGING = os.getenv("ABR_PACKAGING", "none")
+
+# HLS segment length in seconds; encodes force a keyframe on every boundary so variants stay GOP-aligned
+HLS_SEGMENT_DURATION = int(os.getenv("HLS_SEGMENT_DURATION", "4"))
+
+# fmp4 (CMAF-style fragmented MP4 segments) or mpegts
+HLS_SEGMENT_TYPE = os.getenv("HLS_SEGMENT_TYPE", "fmp4")
+
+# Stream ffmpeg output (fragmented MP4) straight into an S3 multipart upload instead of a temp file
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "false").lower() == "true"
+
+# Multipart part size and how many parts may be uploading at once per output (bounds memory per output)
+STREAM_PART_SIZE = int(os.getenv("STREAM_PART_SIZE_MB", "8")) * 1024 * 1024
+STREAM_MAX_INFLIGHT_PARTS = int(os.getenv("STREAM_MAX_INFLIGHT_PARTS", "2"))
+
+# How workers read the uploaded source:
+#   download - copy the whole object to local disk before probing/encoding
+#   stream   - ffprobe/ffmpeg read a short-lived presigned GET URL directly (HTTP range requests),
+#              so probing and encoding start immediately
+INPUT_MODE = os.getenv("INPUT_MODE", "download")
+
+# In stream mode, still download a local copy when the encode reads the source several times (per_rendition)
+INPUT_CACHE_MULTIPASS = os.getenv("INPUT_CACHE_MULTIPASS", "true").lower() == "true"
+
+# Lifetime of the presigned input URL; must outlast the longest encode that reads it
+INPUT_URL_EXPIRATION = int(os.getenv("INPUT_URL_EXPIRATION", "3600"))
+
+# Largest source accepted by the upload endpoints
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "2048")) * 1024 * 1024
+
+# Part size offered to clients for multipart uploads (raised automatically to stay under S3's 10,000 parts)
+MULTIPART_PART_SIZE = int(os.getenv("MULTIPART_PART_SIZE_MB", "16")) * 1024 * 1024
+
+# Seconds a job record stays in the Redis read-through cache (writes refresh or drop it earlier)
+JOB_CACHE_TTL = int(os.getenv("JOB_CACHE_TTL", "300"))
+
+# Lifetime of presigned download/playback URLs, and how long before expiry a cached URL stops being handed out
+PRESIGNED_URL_EXPIRATION = int(os.getenv("PRESIGNED_URL_EXPIRATION", "3600"))
+PRESIGNED_URL_REUSE_MARGIN = int(os.getenv("PRESIGNED_URL_REUSE_MARGIN", "600"))
+
+# Stream-copy the video of a rung the source already matches exactly (h264/yuv420p, not with HLS packaging)
+LADDER_STREAM_COPY = os.getenv("LADDER_STREAM_COPY", "true").lower() == "true"
+
+# Cost-aware routing: every job is estimated as duration x output pixels of its ladder, in seconds of
+# 1080p encoding, and sent to the short or the long queue so short clips never wait behind long videos.
+# Workers started without -Q consume every queue; dedicated pools pick one with -Q.
+TRANSCODE_QUEUE_SHORT = os.getenv("TRANSCODE_QUEUE_SHORT", "transcode_short")
+TRANSCODE_QUEUE_LONG = os.getenv("TRANSCODE_QUEUE_LONG", "transcode_long")
+SHORT_JOB_MAX_COST = float(os.getenv("SHORT_JOB_MAX_COST", "600"))
+# Seconds the API's ffprobe of the uploaded source (over a presigned URL) may take before the job is routed unprobed
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "10"))
+
+# Tasks a worker process reserves ahead; 1 keeps a long encode from holding queued jobs hostage
+WORKER_PREFETCH_MULTIPLIER = int(os.getenv("WORKER_PREFETCH_MULTIPLIER", "1"))
+
+# Port of the worker's Prometheus exporter (0 disables it). With the prefork pool, set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory so the samples of every child process are exported.
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9808"))
+
+# Expired jobs purged per cleanup batch (one short transaction each), and how long a batch may wait for row locks
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "200"))
+CLEANUP_LOCK_TIMEOUT_MS = int(os.getenv("CLEANUP_LOCK_TIMEOUT_MS", "5000"))
+
+# Per-job scratch workspaces: every task writes under WORKSPACE_ROOT/<job id>[_<scope>] (a volume of its own in
+# docker-compose). A task is admitted only if its predicted usage (local source copy plus renditions, each
+# predicted as WORKSPACE_OUTPUT_RATIO x the source size) keeps WORKSPACE_MIN_FREE free on top of what running
+# tasks reserved; otherwise it is re-queued after WORKSPACE_ADMISSION_DELAY seconds, up to WORKSPACE_ADMISSION_RETRIES times.
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "/tmp/streamscale")
+WORKSPACE_MIN_FREE = int(os.getenv("WORKSPACE_MIN_FREE_MB", "1024")) * 1024 * 1024
+WORKSPACE_OUTPUT_RATIO = float(os.getenv("WORKSPACE_OUTPUT_RATIO", "1.0"))
+WORKSPACE_ADMISSION_DELAY = int(os.getenv("WORKSPACE_ADMISSION_DELAY", "30"))
+WORKSPACE_ADMISSION_RETRIES = int(os.getenv("WORKSPACE_ADMISSION_RETRIES", "40"))
+
+# Workspaces whose task is gone (dead process on this host, or older than this) are removed by the orphan sweep
+WORKSPACE_MAX_AGE_HOURS = int(os.getenv("WORKSPACE_MAX_AGE_HOURS", "24"))
+
+# Resource governor (worker.tasks.resources). Worker CPU and memory are read from the container's cgroup limits.
+# Every encode takes one slot per thread from a node-wide pool of one slot per CPU (more when its predicted memory
+# needs it), so small rungs run side by side while large ones queue for free cores instead of oversubscribing.
+#   WORKER_CONCURRENCY           - worker processes; 0 sizes it from the detected CPUs and memory
+#   ENCODE_MEGAPIXELS_PER_THREAD - output pixel rate one encoder thread is given (1080p30 is ~62 Mpx/s)
+#   ENCODE_MEMORY_BASE_MB / ENCODE_MEMORY_PER_MEGAPIXEL_MB - predicted encoder memory: base + per megapixel of frame
+#   ENCODE_MEMORY_FRACTION       - share of the memory limit the encodes may use together
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "0"))
+ENCODE_MEGAPIXELS_PER_THREAD = float(os.getenv("ENCODE_MEGAPIXELS_PER_THREAD", "16"))
+ENCODE_MEMORY_BASE = int(os.getenv("ENCODE_MEMORY_BASE_MB", "64")) * 1024 * 1024
+ENCODE_MEMORY_PER_MEGAPIXEL = int(os.getenv("ENCODE_MEMORY_PER_MEGAPIXEL_MB", "256")) * 1024 * 1024
+ENCODE_MEMORY_FRACTION = float(os.getenv("ENCODE_MEMORY_FRACTION", "0.8"))
+
+# Transcode tasks are acknowledged after they finish, so the task of a worker that died is delivered again.
+# An attempt delivered more than TASK_MAX_DELIVERIES times is failed instead. A retried task keeps the workspace
+# with its downloaded source for WORKSPACE_RETAIN_SECONDS, in case it runs on the same node again.
+TASK_MAX_DELIVERIES = int(os.getenv("TASK_MAX_DELIVERIES", "3"))
+WORKSPACE_RETAIN_SECONDS = int(os.getenv("WORKSPACE_RETAIN_SECONDS", "900"))
+
+# Progressive availability: renditions are encoded and published cheapest first (stream copies, then by output
+# pixels) so the first playable one is ready as early as possible; "ladder" keeps the configured order.
+# In single_pass mode the first rendition is also encoded on its own ahead of the single pass over the others,
+# at the cost of one extra decode of the source.
+RENDITION_ORDER = os.getenv("RENDITION_ORDER", "cheapest_first")
+PROGRESSIVE_FIRST_RENDITION = os.getenv("PROGRESSIVE_FIRST_RENDITION", "true").lower() == "true"
+
+# Throughput model (app.services.estimator). Every finished encode is stored in encode_stats with the node class of its
+# worker (NODE_CLASS, "<cpus>cpu" when unset). Predictions use the median output pixel rate per rung over the last
+# ESTIMATOR_WINDOW_DAYS; a rung with fewer than ESTIMATOR_MIN_SAMPLES encodes uses the rate of all rungs, and without any
+# history ESTIMATOR_DEFAULT_MEGAPIXELS_PER_SECOND. The API reloads the rates every ESTIMATOR_REFRESH_SECONDS.
+# Only the encodes of one node class are used, ESTIMATOR_NODE_CLASS (the class of the workers that take the jobs) or,
+# when unset, the class with the most encodes in the window.
+# Stats older than ENCODE_STATS_RETENTION_DAYS are purged by the cleanup task.
+NODE_CLASS = os.getenv("NODE_CLASS", "")
+ESTIMATOR_NODE_CLASS = os.getenv("ESTIMATOR_NODE_CLASS", "")
+ESTIMATOR_WINDOW_DAYS = int(os.getenv("ESTIMATOR_WINDOW_DAYS", "7"))
+ESTIMATOR_MIN_SAMPLES = int(os.getenv("ESTIMATOR_MIN_SAMPLES", "5"))
+ESTIMATOR_DEFAULT_MEGAPIXELS_PER_SECOND = float(os.getenv("ESTIMATOR_DEFAULT_MEGAPIXELS_PER_SECOND", "60"))
+ESTIMATOR_REFRESH_SECONDS = int(os.getenv("ESTIMATOR_REFRESH_SECONDS", "300"))
+ENCODE_STATS_RETENTION_DAYS = int(os.getenv("ENCODE_STATS_RETENTION_DAYS", "30"))
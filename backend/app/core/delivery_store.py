@@ -0,0 +1,41 @@
+from app.core.redis_client import get_redis
+
+# Counters only matter while a task can still be redelivered
+DELIVERY_TTL = 2 * 24 * 60 * 60
+
+class DeliveryStore:
+    """Counts how often the broker delivered one attempt of a task.
+
+    Tasks are acknowledged late, so a message whose worker died (OOM kill,
+    lost node) is delivered again. An attempt that keeps killing its worker
+    would otherwise be redelivered forever.
+
+    Also counts the retries a task spent waiting for scratch space, which
+    Celery does not tell apart from retries after a failure.
+    """
+
+    def _key(self, task_id: str, retries: int) -> str:
+        return f"deliveries:{task_id}:{retries}"
+
+    # Records a delivery of the attempt and returns how many there have been, this one included
+    def record(self, task_id: str, retries: int) -> int:
+        pipe = get_redis().pipeline()
+        pipe.incr(self._key(task_id, retries))
+        pipe.expire(self._key(task_id, retries), DELIVERY_TTL)
+        return pipe.execute()[0]
+
+    def _deferrals_key(self, task_id: str) -> str:
+        return f"deferrals:{task_id}"
+
+    # Records one deferral of the task and returns how many there have been, this one included
+    def record_deferral(self, task_id: str) -> int:
+        pipe = get_redis().pipeline()
+        pipe.incr(self._deferrals_key(task_id))
+        pipe.expire(self._deferrals_key(task_id), DELIVERY_TTL)
+        return pipe.execute()[0]
+
+    def deferrals(self, task_id: str) -> int:
+        return int(get_redis().get(self._deferrals_key(task_id)) or 0)
+
+# A single instance which we can use globally
+delivery_store = DeliveryStore()
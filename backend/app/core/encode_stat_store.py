@@ -0,0 +1,55 @@
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import EncodeStat
+from datetime import datetime
+
+# Output pixels encoded per second of wall time, the throughput the estimator works with
+PIXEL_RATE = EncodeStat.source_duration * EncodeStat.fps * EncodeStat.pixels / EncodeStat.wall_seconds
+
+class EncodeStatStore:
+
+    def record(self,db:Session,**fields):
+        db.add(EncodeStat(**fields))
+        db.commit()
+
+    # Median pixel rate and number of encodes per rung since the given time, plus "*" for every rung together
+    # (single-pass runs, stored as rung "all", are left out of it: their pixel rate sums several outputs).
+    # node_class limits the history to the workers of one class.
+    async def apixel_rates(self,db:AsyncSession,since:datetime,node_class:str=None)->dict:
+        query = select(
+            EncodeStat.rung,
+            func.percentile_cont(0.5).within_group(PIXEL_RATE),
+            func.count()
+        ).where(EncodeStat.created_at >= since, EncodeStat.wall_seconds > 0)
+        if node_class:
+            query = query.where(EncodeStat.node_class == node_class)
+
+        rates = {}
+        for rung, rate, samples in (await db.execute(query.group_by(EncodeStat.rung))).all():
+            rates[rung] = (rate, samples)
+        rate, samples = (await db.execute(query.where(EncodeStat.rung != "all").with_only_columns(
+            func.percentile_cont(0.5).within_group(PIXEL_RATE), func.count()
+        ))).one()
+        rates["*"] = (rate, samples)
+        return rates
+
+    # Node class with the most encodes since the given time, or None without any
+    async def abusiest_node_class(self,db:AsyncSession,since:datetime)->str:
+        query = (
+            select(EncodeStat.node_class)
+            .where(EncodeStat.created_at >= since)
+            .group_by(EncodeStat.node_class)
+            .order_by(func.count().desc(), EncodeStat.node_class)
+            .limit(1)
+        )
+        return (await db.execute(query)).scalar()
+
+    # Deletes stats older than the given time, returns the number of rows removed
+    def delete_before(self,db:Session,before:datetime)->int:
+        deleted = db.query(EncodeStat).filter(EncodeStat.created_at < before).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+# A single instance which we can use globally
+encode_stat_store = EncodeStatStore()
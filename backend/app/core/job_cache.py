@@ -0,0 +1,152 @@
+import json
+import logging
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from redis.exceptions import WatchError
+from app.core.config import JOB_CACHE_TTL
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobRecord:
+    """Compact, read-only copy of a Job row as the API routes need it."""
+
+    job_id: str
+    original_filename: str
+    input_object_name: str
+    status: str
+    resolutions: list = field(default_factory=list)
+    created_at: datetime = None
+    completed_at: datetime = None
+    # {rung: {"status", "error", "object_name", "bytes", "duration", "bitrate", "etag"}} from the renditions table
+    renditions: dict = field(default_factory=dict)
+    # ffprobe analysis of the source (Job.source_info), which the ETA is estimated from
+    source_info: dict = None
+    # Ladder the job is encoded with (Job.ladder, {rung: scale}), which progress and ETA are weighted by
+    ladder: dict = None
+    # Declared upload size (Job.upload_size), which bounds a multipart upload
+    upload_size: int = None
+
+    @classmethod
+    def from_job(cls, job, renditions=()):
+        return cls(
+            job_id=str(job.job_id),
+            original_filename=job.original_filename,
+            input_object_name=job.input_object_name,
+            status=job.status,
+            resolutions=list(job.resolutions or []),
+            created_at=job.created_at,
+            completed_at=job.completed_at,
+            renditions={
+                rendition.name: {
+                    "status": rendition.status,
+                    "error": rendition.error,
+                    "object_name": rendition.object_name,
+                    "bytes": rendition.bytes,
+                    "duration": rendition.duration,
+                    "bitrate": rendition.bitrate,
+                    "etag": rendition.etag,
+                }
+                for rendition in renditions
+            },
+            source_info=job.source_info,
+            ladder=job.ladder,
+            upload_size=job.upload_size,
+        )
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        for name in ("created_at", "completed_at"):
+            data[name] = data[name].isoformat() if data[name] else None
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str):
+        data = json.loads(raw)
+        for name in ("created_at", "completed_at"):
+            data[name] = datetime.fromisoformat(data[name]) if data[name] else None
+        return cls(**data)
+
+
+class JobCache:
+    """Read-through cache of job records in Redis.
+
+    Status polls and download redirects read the same few recent jobs over and
+    over; serving them from Redis keeps the small Postgres pool free for writes.
+    Redis errors are logged and treated as a miss, never as a failed request.
+
+    Every invalidation bumps a per-job generation counter. A route that loaded
+    the record from Postgres only caches it when the generation is still the
+    one it saw before the read, so a record read just before a worker's commit
+    cannot overwrite the invalidation that followed it.
+    """
+
+    def key(self, job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def generation_key(self, job_id: str) -> str:
+        return f"job:{job_id}:generation"
+
+    async def aget(self, job_id: str):
+        try:
+            raw = await get_async_redis().get(self.key(job_id))
+            return JobRecord.from_json(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Job cache read failed for {job_id}: {e}")
+            return None
+
+    async def aset(self, record: JobRecord):
+        try:
+            await get_async_redis().set(self.key(record.job_id), record.to_json(), ex=JOB_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Job cache write failed for {record.job_id}: {e}")
+
+    # Generation to pass to aset_if_current, read before the record is loaded; None when Redis is unavailable
+    async def ageneration(self, job_id: str):
+        try:
+            return await get_async_redis().get(self.generation_key(job_id)) or ""
+        except Exception as e:
+            logger.warning(f"Job cache generation read failed for {job_id}: {e}")
+            return None
+
+    # Caches a record loaded from Postgres unless the job was invalidated since the generation was read
+    async def aset_if_current(self, record: JobRecord, generation: str):
+        if generation is None:
+            return
+        generation_key = self.generation_key(record.job_id)
+        try:
+            async with get_async_redis().pipeline() as pipe:
+                await pipe.watch(generation_key)
+                if (await pipe.get(generation_key) or "") != generation:
+                    return
+                pipe.multi()
+                pipe.set(self.key(record.job_id), record.to_json(), ex=JOB_CACHE_TTL)
+                await pipe.execute()
+        except WatchError:
+            # Invalidated while writing; the next read loads the newer row
+            return
+        except Exception as e:
+            logger.warning(f"Job cache write failed for {record.job_id}: {e}")
+
+    def set(self, record: JobRecord):
+        try:
+            get_redis().set(self.key(record.job_id), record.to_json(), ex=JOB_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Job cache write failed for {record.job_id}: {e}")
+
+    # Used by the workers: the next read goes to Postgres and repopulates the entry. The generation outlives
+    # the entry, so a read that started before the invalidation still sees that it is stale.
+    def invalidate(self, job_id: str):
+        try:
+            pipe = get_redis().pipeline()
+            pipe.incr(self.generation_key(job_id))
+            pipe.expire(self.generation_key(job_id), JOB_CACHE_TTL)
+            pipe.delete(self.key(job_id))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Job cache invalidation failed for {job_id}: {e}")
+
+# A single instance which we can use globally
+job_cache = JobCache()
@@ -1,22 +1,31 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models import Job
+from app.core.job_cache import job_cache, JobRecord
+from app.core.rendition_store import rendition_store
 from datetime import datetime
 
+# Statuses the worker writes last; a record in one of them already includes every rendition
+FINISHED_JOB_STATUSES = {"SUCCESS", "FAILED", "COMPLETED", "PARTIAL_SUCCESS"}
+
 class JobStore:
 
     # Create and add the job in the database
-    def create_job(self,db:Session,job_id:str,original_filename:str,input_object_name:str,resolutions:list=None)->Job:
+    def create_job(self,db:Session,job_id:str,original_filename:str,input_object_name:str,resolutions:list=None,upload_size:int=None)->Job:
 
         db_job = Job(
             job_id = job_id,
             original_filename = original_filename,
             input_object_name = input_object_name,
+            upload_size = upload_size,
             status = "PENDING",
             resolutions = resolutions or []
         )
         db.add(db_job)
         db.commit()
         db.refresh(db_job)
+        job_cache.set(JobRecord.from_job(db_job))
         return db_job
 
     # Helps to return the job according to the id
@@ -34,6 +43,101 @@ class JobStore:
 
             db.commit()
             db.refresh(db_job)
+            # Status changes from the workers only drop the cached copy so they never race an API write-through
+            job_cache.invalidate(job_id)
+        return db_job
+
+    # Stores the source fingerprint once the upload is known to be complete
+    def set_fingerprint(self,db:Session,job_id:str,fingerprint:str)->Job:
+        db_job = self.get_job(db,job_id)
+        if db_job:
+            db_job.fingerprint = fingerprint
+            db.commit()
+            job_cache.invalidate(job_id)
+        return db_job
+
+    # Stores the probe result and the ladder computed from it ({rung: scale}; resolutions keeps the rung names)
+    def set_source_info(self,db:Session,job_id:str,source_info:dict,ladder:dict)->Job:
+        db_job = self.get_job(db,job_id)
+        if db_job:
+            db_job.source_info = source_info
+            db_job.resolutions = list(ladder)
+            db_job.ladder = dict(ladder)
+            db.commit()
+            job_cache.invalidate(job_id)
+        return db_job
+
+    # Most recent other job with the same source that finished with every rendition
+    def find_completed_duplicate(self,db:Session,job_id:str,fingerprint:str)->Job:
+        return (
+            db.query(Job)
+            .filter(
+                Job.fingerprint == fingerprint,
+                Job.job_id != job_id,
+                Job.status == "SUCCESS"
+            )
+            .order_by(Job.completed_at.desc())
+            .first()
+        )
+
+    # Async variants of the methods above for the FastAPI routes (AsyncSession from get_async_db)
+    async def acreate_job(self,db:AsyncSession,job_id:str,original_filename:str,input_object_name:str,resolutions:list=None,upload_size:int=None)->Job:
+
+        db_job = Job(
+            job_id = job_id,
+            original_filename = original_filename,
+            input_object_name = input_object_name,
+            upload_size = upload_size,
+            status = "PENDING",
+            resolutions = resolutions or []
+        )
+        db.add(db_job)
+        await db.commit()
+        await db.refresh(db_job)
+        await job_cache.aset(JobRecord.from_job(db_job))
+        return db_job
+
+    async def aget_job(self,db:AsyncSession,job_id:str)->Job:
+        result = await db.execute(select(Job).where(Job.job_id == job_id))
+        return result.scalars().first()
+
+    # Read-through lookup for the routes: returns a JobRecord from Redis, or loads and caches it.
+    # fresh=True skips the cache, e.g. when a cached record of a running job may miss a rendition.
+    # The record is only cached if no worker invalidated the job while it was loaded (see JobCache).
+    async def aget_job_record(self,db:AsyncSession,job_id:str,fresh:bool=False)->JobRecord:
+        record = None if fresh else await job_cache.aget(job_id)
+        if record:
+            return record
+        generation = await job_cache.ageneration(job_id)
+        db_job = await self.aget_job(db,job_id)
+        if not db_job:
+            return None
+        record = JobRecord.from_job(db_job, await rendition_store.aget_renditions(db,job_id))
+        await job_cache.aset_if_current(record, generation)
+        return record
+
+    async def aset_source_info(self,db:AsyncSession,job_id:str,source_info:dict,ladder:dict,predicted_encode_seconds:float=None)->Job:
+        db_job = await self.aget_job(db,job_id)
+        if db_job:
+            db_job.source_info = source_info
+            db_job.resolutions = list(ladder)
+            db_job.ladder = dict(ladder)
+            db_job.predicted_encode_seconds = predicted_encode_seconds
+            await db.commit()
+        return db_job
+
+    async def aupdate_job_status(self,db:AsyncSession,job_id:str,status:str,is_completed:bool=False)->Job:
+        db_job = await self.aget_job(db,job_id)
+        if db_job:
+            db_job.status = status
+
+            if is_completed:
+                db_job.completed_at = datetime.utcnow()
+
+            generation = await job_cache.ageneration(job_id)
+            await db.commit()
+            await db.refresh(db_job)
+            await job_cache.aset_if_current(JobRecord.from_job(db_job, await rendition_store.aget_renditions(db,job_id)), generation)
         return db_job
 
 # A single instance which we can use globally
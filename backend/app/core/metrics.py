@@ -0,0 +1,141 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from app.core.config import TRANSCODE_QUEUE_SHORT, TRANSCODE_QUEUE_LONG
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics shared by the API and the workers.
+# Processes that fork (gunicorn, Celery prefork) need PROMETHEUS_MULTIPROC_DIR set to an empty
+# directory, so every child writes its samples there and the exporter aggregates them.
+
+# Encodes take minutes, requests milliseconds
+SHORT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "streamscale_http_request_duration_seconds", "API request latency by route",
+    ["method", "route", "status"], buckets=SHORT_BUCKETS
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "streamscale_db_pool_checkout_seconds", "Time spent waiting for (or opening) a pooled database connection",
+    ["pool"], buckets=SHORT_BUCKETS
+)
+S3_REQUEST_SECONDS = Histogram(
+    "streamscale_s3_request_duration_seconds", "S3 API call latency by operation",
+    ["operation", "outcome"], buckets=SHORT_BUCKETS
+)
+WORKER_STAGE_SECONDS = Histogram(
+    "streamscale_worker_stage_duration_seconds", "Duration of transcode stages (download, probe, encode, upload) by rung",
+    ["stage", "rung"], buckets=STAGE_BUCKETS
+)
+ENCODE_SPEED = Histogram(
+    "streamscale_encode_speed_ratio", "Seconds of media encoded per second of wall time, by rung",
+    ["rung"], buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+UPLOAD_THROUGHPUT = Histogram(
+    "streamscale_upload_throughput_bytes_per_second", "Throughput of rendition uploads to S3",
+    ["rung"], buckets=(1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6, 500e6)
+)
+ENCODE_SLOT_WAIT_SECONDS = Histogram(
+    "streamscale_encode_slot_wait_seconds", "Time encodes waited for free CPU/memory slots on their node, by rung",
+    ["rung"], buckets=STAGE_BUCKETS
+)
+FIRST_RENDITION_SECONDS = Histogram(
+    "streamscale_time_to_first_rendition_seconds", "Time from the upload request to the first downloadable rendition of a job",
+    buckets=STAGE_BUCKETS
+)
+TASK_RETRIES = Counter("streamscale_task_retries_total", "Celery task retries", ["task"])
+TASK_FAILURES = Counter("streamscale_task_failures_total", "Celery tasks that failed for good", ["task"])
+RENDITION_FAILURES = Counter("streamscale_rendition_failures_total", "Renditions that failed to encode or upload", ["rung"])
+CLEANUP_JOBS_DELETED = Counter("streamscale_cleanup_jobs_deleted_total", "Expired jobs purged by the cleanup task", ["status"])
+CLEANUP_OBJECTS_DELETED = Counter("streamscale_cleanup_objects_deleted_total", "S3 objects deleted by the cleanup task")
+CLEANUP_ERRORS = Counter("streamscale_cleanup_errors_total", "Cleanup failures (s3: objects that could not be deleted, lock: batches given up on a lock timeout, run: failed runs)", ["kind"])
+WORKSPACE_DEFERRALS = Counter("streamscale_workspace_deferrals_total", "Tasks re-queued because their scratch workspace did not fit on disk", ["task"])
+CLEANUP_BATCH_SECONDS = Histogram(
+    "streamscale_cleanup_batch_duration_seconds", "Duration of one cleanup batch (S3 deletes and row deletes)",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+
+# Observes the duration of a block under WORKER_STAGE_SECONDS (only when it completes without raising)
+@contextmanager
+def track_stage(stage: str, rung: str = ""):
+    started = time.perf_counter()
+    yield
+    WORKER_STAGE_SECONDS.labels(stage=stage, rung=rung).observe(time.perf_counter() - started)
+
+
+# Encode time of one rung (or "all" for a single-pass encode) and the speed relative to the media duration
+def observe_encode(rung: str, seconds: float, media_duration: float):
+    WORKER_STAGE_SECONDS.labels(stage="encode", rung=rung).observe(seconds)
+    if seconds > 0 and media_duration and media_duration > 1:
+        ENCODE_SPEED.labels(rung=rung).observe(media_duration / seconds)
+
+
+def observe_upload(rung: str, seconds: float, size: int):
+    WORKER_STAGE_SECONDS.labels(stage="upload", rung=rung).observe(seconds)
+    if seconds > 0:
+        UPLOAD_THROUGHPUT.labels(rung=rung).observe(size / seconds)
+
+
+# Times every S3 call made through a boto3 client
+def instrument_s3_client(client):
+    def before_call(model, context, **kwargs):
+        context["metrics_call"] = (model.name, time.perf_counter())
+
+    def after_call(context, **kwargs):
+        observe(context, "ok")
+
+    # Emitted when the call raised (connection errors, timeouts) instead of returning a response
+    def after_call_error(context, **kwargs):
+        observe(context, "error")
+
+    def observe(context, outcome):
+        call = context.pop("metrics_call", None)
+        if call:
+            operation, started = call
+            S3_REQUEST_SECONDS.labels(operation=operation, outcome=outcome).observe(time.perf_counter() - started)
+
+    client.meta.events.register("before-call.s3", before_call)
+    client.meta.events.register("after-call.s3", after_call)
+    client.meta.events.register("after-call-error.s3", after_call_error)
+    return client
+
+
+class QueueDepthCollector:
+    """Reports the number of messages waiting in each transcode queue (Redis broker lists) at scrape time."""
+
+    def collect(self):
+        from app.core.redis_client import get_redis
+        gauge = GaugeMetricFamily("streamscale_queue_depth", "Messages waiting in the Celery queue", labels=["queue"])
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            queues = ("celery", TRANSCODE_QUEUE_SHORT, TRANSCODE_QUEUE_LONG)
+            for queue in queues:
+                pipe.llen(queue)
+            for queue, depth in zip(queues, pipe.execute()):
+                gauge.add_metric([queue], depth)
+        except Exception as e:
+            logger.warning(f"Could not read queue depths: {e}")
+        yield gauge
+
+
+# Registry to expose: the samples of every process in multiprocess mode, otherwise this process's
+def metrics_registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+_queue_registry = CollectorRegistry()
+_queue_registry.register(QueueDepthCollector())
+
+# Text exposition for the API's /metrics endpoint (process metrics plus the queue depths)
+def render_metrics() -> bytes:
+    return generate_latest(metrics_registry()) + generate_latest(_queue_registry)
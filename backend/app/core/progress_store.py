@@ -0,0 +1,59 @@
+import json
+from app.core.redis_client import get_redis, get_async_redis
+
+# Progress entries expire on their own once nobody is polling the job anymore
+PROGRESS_TTL = 24 * 60 * 60
+
+# Job states after which no more events are published
+FINAL_STATES = {"COMPLETED", "PARTIAL_SUCCESS", "FAILED"}
+
+class ProgressStore:
+    """Per-job rendition progress kept in a Redis hash (one field per rendition).
+
+    Lets several Celery subtasks report progress for the same job without
+    overwriting each other's state in the result backend. Every change is
+    also published on the job's pub/sub channel for the streaming endpoint.
+    """
+
+    def key(self, job_id: str) -> str:
+        return f"progress:{job_id}"
+
+    def channel(self, job_id: str) -> str:
+        return f"progress:{job_id}:events"
+
+    # Store the progress entry of one rendition and publish it as a delta
+    def set_rendition(self, job_id: str, res_name: str, data: dict):
+        self.set_renditions(job_id, {res_name: data})
+
+    # Store several rendition entries in one round trip. deltas ({res_name: changed fields}) limits
+    # what is published to the fields that actually changed; clients merge them into the entry they have.
+    def set_renditions(self, job_id: str, entries: dict, deltas: dict = None):
+        if not entries:
+            return
+        key = self.key(job_id)
+        pipe = get_redis().pipeline()
+        pipe.hset(key, mapping={res_name: json.dumps(data) for res_name, data in entries.items()})
+        pipe.expire(key, PROGRESS_TTL)
+        for res_name, data in (entries if deltas is None else deltas).items():
+            pipe.publish(self.channel(job_id), json.dumps({"type":"progress","res":res_name,**data}))
+        pipe.execute()
+
+    # Publish a job-level state change (final states end the event stream)
+    def publish_state(self, job_id: str, state: str):
+        get_redis().publish(self.channel(job_id), json.dumps({"type":"state","state":state}))
+
+    # Returns {res_name: {...}} for every rendition that has reported so far
+    def get_all(self, job_id: str) -> dict:
+        raw = get_redis().hgetall(self.key(job_id))
+        return {res_name: json.loads(data) for res_name, data in raw.items()}
+
+    # get_all for the API's event loop
+    async def aget_all(self, job_id: str) -> dict:
+        raw = await get_async_redis().hgetall(self.key(job_id))
+        return {res_name: json.loads(data) for res_name, data in raw.items()}
+
+    def clear(self, job_id: str):
+        get_redis().delete(self.key(job_id))
+
+# A single instance which we can use globally
+progress_store = ProgressStore()
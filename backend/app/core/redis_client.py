@@ -0,0 +1,25 @@
+import redis
+import redis.asyncio as aioredis
+from app.core.celery_app import REDIS_URL
+
+# Shared Redis connection (same instance as the Celery broker/result backend).
+# Created lazily so the app can import this module even if Redis is unavailable.
+_redis_client = None
+
+def get_redis():
+    """Get or create the Redis client singleton."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+# Async client for the API process (pub/sub subscriptions in streaming endpoints)
+_async_redis_client = None
+
+def get_async_redis():
+    """Get or create the asyncio Redis client singleton."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _async_redis_client
@@ -0,0 +1,49 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+from app.db.models import Rendition
+from datetime import datetime
+
+class RenditionStore:
+
+    # Insert or update the row of one rendition (one row per job and rung)
+    def upsert(self,db:Session,job_id:str,name:str,**fields):
+        statement = insert(Rendition).values(job_id=job_id,name=name,**fields)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Rendition.job_id,Rendition.name],
+            set_={key:statement.excluded[key] for key in fields}
+        )
+        db.execute(statement)
+        db.commit()
+
+    # Marks renditions as being encoded and (re)starts their timing
+    def mark_started(self,db:Session,job_id:str,names:list):
+        for name in names:
+            self.upsert(db,job_id,name,status="PROCESSING",error=None,started_at=datetime.utcnow(),completed_at=None)
+
+    def mark_completed(self,db:Session,job_id:str,name:str,object_name:str,size:int,etag:str,duration:float):
+        self.upsert(
+            db,job_id,name,
+            status="COMPLETED",
+            error=None,
+            object_name=object_name,
+            bytes=size,
+            etag=etag,
+            duration=duration or None,
+            bitrate=int(size * 8 / duration) if duration else None,
+            completed_at=datetime.utcnow()
+        )
+
+    def mark_failed(self,db:Session,job_id:str,name:str,error:str):
+        self.upsert(db,job_id,name,status="FAILED",error=error,completed_at=datetime.utcnow())
+
+    def get_renditions(self,db:Session,job_id:str)->list:
+        return db.query(Rendition).filter(Rendition.job_id == job_id).all()
+
+    async def aget_renditions(self,db:AsyncSession,job_id:str)->list:
+        result = await db.execute(select(Rendition).where(Rendition.job_id == job_id))
+        return list(result.scalars().all())
+
+# A single instance which we can use globally
+rendition_store = RenditionStore()
@@ -1,6 +1,10 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker,declarative_base
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS
+import time
 import os
 
 # Connection to PostgreSQL (Neon in production, local/Docker for development)
@@ -9,12 +13,27 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set")
 
+# Pools that report how long every checkout waited for a free connection (or for a new one to open)
+class TimedQueuePool(QueuePool):
+    metrics_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(pool=self.metrics_label).observe(time.perf_counter() - started)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool, TimedQueuePool):
+    metrics_label = "async"
+
 # actual connection is made here
 # Pool sized for serverless PostgreSQL (Neon, Railway, etc.)
 # Smaller pool prevents connection limit exhaustion
 engine = create_engine(
     DATABASE_URL,
-    poolclass = QueuePool,
+    poolclass = TimedQueuePool,
     pool_size = 2,           # Reduced for serverless compatibility
     max_overflow = 3,        # Reduced for serverless compatibility
     pool_pre_ping = True,    # Verify connections before use
@@ -29,10 +48,57 @@ sessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
 # Base for the database models
 Base = declarative_base()
 
-# This is used in the Fastapi routes
+# This is used by the Celery workers (and anything else that runs outside the event loop)
 def get_db():
     db = sessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# The FastAPI routes use an asyncpg engine so a slow database round trip does not block the event loop.
+# asyncpg does not understand libpq's sslmode/channel_binding, so the same DATABASE_URL is translated here.
+def async_database_url(url: str):
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        return url
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    if sslmode:
+        query["ssl"] = sslmode
+    return url.set(drivername="postgresql+asyncpg", query=query)
+
+
+_async_engine = None
+_async_session = None
+
+# Created on first use so the workers, which only use the sync engine, never need asyncpg
+def get_async_sessionmaker():
+    global _async_engine, _async_session
+    if _async_session is None:
+        _async_engine = create_async_engine(
+            async_database_url(DATABASE_URL),
+            poolclass = TimedAsyncQueuePool,
+            pool_size = 2,
+            max_overflow = 3,
+            pool_pre_ping = True,
+            pool_recycle = 300,
+            pool_timeout = 30,
+            echo = False
+        )
+        # expire_on_commit=False: attributes stay readable after commit without another (implicit, sync) load
+        _async_session = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_session
+
+
+# This is used in the Fastapi routes
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
\ No newline at end of file
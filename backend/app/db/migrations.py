@@ -0,0 +1,22 @@
+from sqlalchemy import text
+
+# create_all() only creates missing tables, it never adds columns to a table that already exists.
+# Columns and indexes added to existing tables after the first release are listed here;
+# every statement is idempotent so this can run on every startup.
+SCHEMA_UPDATES = [
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS fingerprint TEXT",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_fingerprint ON jobs (fingerprint)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS source_info JSONB",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_status_created_at ON jobs (status, created_at)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS predicted_encode_seconds DOUBLE PRECISION",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS upload_size BIGINT",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS ladder JSONB",
+]
+
+
+def apply_schema_updates(engine):
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPDATES:
+            conn.execute(text(statement))
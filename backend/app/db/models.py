@@ -1,17 +1,23 @@
-from sqlalchemy import Column, String, Text, DateTime
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy import Column, String, Text, DateTime, Integer, BigInteger, Float, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
 from app.db.database import Base
 from datetime import datetime
 import uuid
 
 class Job(Base):
     __tablename__ = "jobs"
+    __table_args__ = (
+        # The cleanup task walks expired jobs per status in created_at order
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
 
     job_id = Column(UUID(as_uuid=True),primary_key=True,default=uuid.uuid4)
 
     # Filenames
     original_filename = Column(Text,nullable=False)
     input_object_name = Column(Text,nullable=False)
+    # Size in bytes the client declared for its upload; a multipart upload may not assemble more than this
+    upload_size = Column(BigInteger,nullable=True)
 
     # Track file processing status
     status = Column(String,nullable=False,default="PENDING")
@@ -19,5 +25,76 @@ class Job(Base):
     # Stores resolution - 360,720 ....
     resolutions = Column(ARRAY(Text),default=list)
 
+    # Content fingerprint of the uploaded source (S3 ETag + size), used to reuse the outputs of identical uploads
+    fingerprint = Column(Text,nullable=True,index=True)
+
+    # ffprobe analysis of the source (duration, size, fps, codecs, bitrates, audio layout); the worker
+    # computes the ladder from it and then overwrites resolutions with the rungs it actually encodes
+    source_info = Column(JSONB,nullable=True)
+    # The encoded ladder as {rung: scale filter or "copy"}; outputs of an identical source are only reused
+    # when the current settings would produce the very same ladder
+    ladder = Column(JSONB,nullable=True)
+
+    # Encode time predicted when the job was queued, in worker-seconds (see app.services.estimator)
+    predicted_encode_seconds = Column(Float,nullable=True)
+
+    created_at = Column(DateTime,default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+
+# One row per output rendition of a job, written by the worker once the upload has finished.
+# Job.resolutions stays the requested ladder; this table says what actually exists in S3.
+class Rendition(Base):
+    __tablename__ = "renditions"
+    __table_args__ = (
+        Index("ix_renditions_job_id_name", "job_id", "name", unique=True),
+    )
+
+    id = Column(Integer,primary_key=True,autoincrement=True)
+    job_id = Column(UUID(as_uuid=True),ForeignKey("jobs.job_id",ondelete="CASCADE"),nullable=False)
+
+    # Ladder rung (360p, 720p ...) and its state: PROCESSING, COMPLETED or FAILED
+    name = Column(String,nullable=False)
+    status = Column(String,nullable=False,default="PROCESSING")
+    error = Column(Text,nullable=True)
+
+    # The uploaded MP4
+    object_name = Column(Text,nullable=True)
+    bytes = Column(BigInteger,nullable=True)
+    etag = Column(Text,nullable=True)
+    duration = Column(Float,nullable=True)
+    bitrate = Column(Integer,nullable=True)
+
+    started_at = Column(DateTime,default=datetime.utcnow)
+    completed_at = Column(DateTime,nullable=True)
+
+
+# One row per finished encode: a rendition, a chunk of a rendition, or a single-pass run over several renditions
+# (rung "all"). Rows are not tied to the job, so the history outlives the cleanup of old jobs; the throughput
+# estimator (app.services.estimator) learns encode speeds from it.
+class EncodeStat(Base):
+    __tablename__ = "encode_stats"
+    __table_args__ = (
+        Index("ix_encode_stats_created_at_rung", "created_at", "rung"),
+    )
+
+    id = Column(Integer,primary_key=True,autoincrement=True)
+    job_id = Column(UUID(as_uuid=True),nullable=True)
+
+    # Ladder rung and how it was encoded: per_rendition, single_pass, fanout or chunked
+    rung = Column(String,nullable=False)
+    mode = Column(String,nullable=False)
+    # Worker node class (NODE_CLASS) and the encoder threads the encode ran with
+    node_class = Column(String,nullable=False)
+    threads = Column(Integer,nullable=True)
+
+    # Seconds of source encoded, output pixels per frame (summed over the rungs of a single pass) and frame rate
+    source_duration = Column(Float,nullable=False)
+    pixels = Column(Float,nullable=False)
+    fps = Column(Float,nullable=False)
+
+    # Wall time of the encode and the speed factor (seconds of source per second of wall time)
+    wall_seconds = Column(Float,nullable=False)
+    speed = Column(Float,nullable=False)
+
     created_at = Column(DateTime,default=datetime.utcnow)
-    completed_at = Column(DateTime, nullable=True)
\ No newline at end of file
@@ -1,30 +1,54 @@
 import time
 import logging
 import os
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import CONTENT_TYPE_LATEST
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from app.core.limiter import limiter
 from app.api.routes import api_router as v1_router
-from app.db.database import engine
+from app.db.database import engine, dispose_async_engine
 from app.db import models
+from app.db.migrations import apply_schema_updates
+from app.core.metrics import HTTP_REQUEST_SECONDS, render_metrics
 
 logger = logging.getLogger(__name__)
 
 models.Base.metadata.create_all(bind=engine)
+apply_schema_updates(engine)
 
 app = FastAPI(title="Streamscale_API")
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.on_event("shutdown")
+async def close_async_engine():
+    await dispose_async_engine()
+
+# Path with the parameters put back as placeholders (/api/v1/tasks/{task_id}/status), so job ids
+# do not create a metrics series per job. Works from the matched parameters because the route
+# object of an included router does not carry its prefix.
+def route_template(request: Request) -> str:
+    if "route" not in request.scope:
+        return "unmatched"
+    placeholders = {str(value): f"{{{name}}}" for name, value in request.path_params.items()}
+    return "/".join(placeholders.get(segment, segment) for segment in request.url.path.split("/"))
+
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
     response = await call_next(request)
     process_time = time.time() - start_time
-    
+
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method,
+        route=route_template(request),
+        status=response.status_code
+    ).observe(process_time)
+
     logger.info(
         f"{request.method} {request.url.path} "
         f"- Status: {response.status_code} "
@@ -67,6 +91,12 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request latency, DB pool waits, S3 calls and queue depths."""
+    # Reading the queue depths talks to Redis synchronously
+    return Response(await run_in_threadpool(render_metrics), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def detailed_health():
     """Detailed health check for monitoring services."""
@@ -83,9 +113,9 @@ async def detailed_health():
     # Check database connectivity
     try:
         from sqlalchemy import text
-        from app.db.database import engine
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        from app.db.database import get_async_sessionmaker
+        async with get_async_sessionmaker()() as db:
+            await db.execute(text("SELECT 1"))
         health_status["checks"]["database"] = "connected"
     except Exception as e:
         health_status["checks"]["database"] = f"error: {str(e)}"
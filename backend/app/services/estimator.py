@@ -0,0 +1,142 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import (
+    TRANSCODE_MODE, CHUNK_DURATION, PROGRESSIVE_FIRST_RENDITION,
+    ESTIMATOR_WINDOW_DAYS, ESTIMATOR_MIN_SAMPLES, ESTIMATOR_DEFAULT_MEGAPIXELS_PER_SECOND, ESTIMATOR_REFRESH_SECONDS,
+    ESTIMATOR_NODE_CLASS
+)
+from app.core.encode_stat_store import encode_stat_store
+from app.services.scheduler import estimate_cost
+from worker.tasks.ffmpeg import STREAM_COPY
+from worker.tasks.ladder import build_ladder, order_ladder
+from worker.tasks.resources import rung_frame
+
+logger = logging.getLogger(__name__)
+
+# Rendition states that need no more encoding
+DONE_STATES = {"COMPLETED", "FAILED"}
+
+
+class EncodeEstimator:
+    """Predicts encode times of a job from the encode history in encode_stats.
+
+    A rung takes its output pixels (duration x fps x frame pixels) divided by the
+    median pixel rate that recent encodes of the same rung reached; a rung with
+    too little history uses the rate of all rungs, and an empty history the
+    configured default. Only encodes of one node class count (ESTIMATOR_NODE_CLASS,
+    or the class with the most encodes), since nodes of different classes encode
+    at different speeds. How the rungs add up to the job's wall time depends on
+    TRANSCODE_MODE. The rates are kept in process memory and reloaded every
+    ESTIMATOR_REFRESH_SECONDS, so status polls do not query the statistics.
+    """
+
+    def __init__(self):
+        self._rates = None
+        self._loaded_at = 0.0
+
+    # {rung: output pixels per second} of recent encodes on the estimated node class, "*" for every rung together
+    async def arates(self, db: AsyncSession) -> dict:
+        if self._rates is not None and time.monotonic() - self._loaded_at < ESTIMATOR_REFRESH_SECONDS:
+            return self._rates
+        try:
+            since = datetime.utcnow() - timedelta(days=ESTIMATOR_WINDOW_DAYS)
+            node_class = ESTIMATOR_NODE_CLASS or await encode_stat_store.abusiest_node_class(db, since)
+            rows = await encode_stat_store.apixel_rates(db, since, node_class) if node_class else {}
+            self._rates = {rung: rate for rung, (rate, samples) in rows.items() if rate and samples >= ESTIMATOR_MIN_SAMPLES}
+        except Exception as e:
+            logger.warning(f"Could not load encode statistics: {e}")
+            await db.rollback()
+            self._rates = self._rates or {}
+        self._loaded_at = time.monotonic()
+        return self._rates
+
+    def _rate(self, rates: dict, rung: str) -> float:
+        return rates.get(rung) or rates.get("*") or ESTIMATOR_DEFAULT_MEGAPIXELS_PER_SECOND * 1e6
+
+    # Output pixels every rung of the ladder encodes (0 for stream copies)
+    def _work(self, source_info: dict, ladder: dict) -> dict:
+        duration = source_info["duration"]
+        work = {}
+        for res_name, res_scale in ladder.items():
+            pixels, fps = (0, 0) if res_scale == STREAM_COPY else rung_frame(res_name, source_info)
+            work[res_name] = duration * fps * pixels
+        return work
+
+    # Wall time of the ffmpeg run that writes each rung under the transcode mode: the rung's own encode, except that
+    # the renditions of one single pass finish together (at the rate single passes reached), and the chunks of a
+    # chunked rung encode side by side (assuming free workers for all of them)
+    def _run_seconds(self, work: dict, rates: dict, duration: float, mode: str) -> dict:
+        seconds = {res_name: pixels / self._rate(rates, res_name) for res_name, pixels in work.items()}
+        if mode == "chunked":
+            share = min(1, CHUNK_DURATION / duration)
+            return {res_name: run * share for res_name, run in seconds.items()}
+        if mode == "single_pass":
+            shared = list(work)[1:] if PROGRESSIVE_FIRST_RENDITION and len(work) > 1 else list(work)
+            if "all" in rates:
+                run = sum(work[res_name] for res_name in shared) / rates["all"]
+            else:
+                run = sum(seconds[res_name] for res_name in shared)
+            seconds.update({res_name: run for res_name in shared})
+        return seconds
+
+    # Job wall time from the wall times of its rungs: one after another (per_rendition), the first rung and then one
+    # run for the others (single_pass), or all in parallel (fanout, chunked)
+    def _combine(self, seconds: dict, mode: str) -> float:
+        if not seconds:
+            return 0.0
+        if mode == "per_rendition":
+            return sum(seconds.values())
+        if mode == "single_pass" and PROGRESSIVE_FIRST_RENDITION and len(seconds) > 1:
+            first, *rest = seconds.values()
+            return first + max(rest)
+        return max(seconds.values())
+
+    # Predicted cost of a job before it runs, or None when the source has no known duration:
+    #   encode_seconds - worker time spent encoding (the capacity the job takes from the fleet)
+    #   eta_seconds    - wall time from the start of encoding to the last rendition, not counting the queue
+    #   renditions     - encode seconds per rung
+    #   cost           - the scheduler's cost in seconds of 1080p output (see estimate_cost)
+    def predict(self, source_info: dict, rates: dict, ladder: dict = None, mode: str = TRANSCODE_MODE):
+        if not (source_info or {}).get("duration"):
+            return None
+        ladder = order_ladder(ladder or build_ladder(source_info), source_info)
+        work = self._work(source_info, ladder)
+        renditions = {res_name: pixels / self._rate(rates, res_name) for res_name, pixels in work.items()}
+        return {
+            "encode_seconds": round(sum(renditions.values()), 1),
+            "eta_seconds": round(self._combine(self._run_seconds(work, rates, source_info["duration"], mode), mode), 1),
+            "renditions": {res_name: round(seconds, 1) for res_name, seconds in renditions.items()},
+            "cost": estimate_cost(source_info, ladder),
+        }
+
+    # Overall progress in percent (every rung weighted by its predicted encode time) and the seconds left,
+    # from the progress entries of a running job. A running rung's remaining time comes from the speed ffmpeg
+    # reports, when there is one. ladder is the one stored with the job, so a changed ladder configuration does
+    # not change the rungs of running jobs. Returns None when the source has no known duration.
+    def progress(self, source_info: dict, rates: dict, tasks: dict, ladder: dict = None, mode: str = TRANSCODE_MODE):
+        if not (source_info or {}).get("duration"):
+            return None
+        duration = source_info["duration"]
+        ladder = order_ladder(ladder or build_ladder(source_info), source_info)
+        work = self._work(source_info, ladder)
+        run_seconds = self._run_seconds(work, rates, duration, mode)
+
+        remaining = {}
+        weighted = 0.0
+        for res_name, seconds in run_seconds.items():
+            entry = tasks.get(res_name) or {}
+            done = 1.0 if entry.get("status") in DONE_STATES else max(0, min(entry.get("progress") or 0, 100)) / 100
+            speed = entry.get("speed")
+            remaining[res_name] = duration * (1 - done) / speed if 0 < done < 1 and speed else seconds * (1 - done)
+            weighted += work[res_name] * done
+
+        total = sum(work.values())
+        return {
+            "overall_progress": int(weighted / total * 100) if total else None,
+            "eta_seconds": round(self._combine(remaining, mode), 1),
+        }
+
+# A single instance which we can use globally
+encode_estimator = EncodeEstimator()
@@ -0,0 +1,120 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from app.core.config import PRESIGNED_URL_EXPIRATION, PRESIGNED_URL_REUSE_MARGIN
+from app.core.redis_client import get_async_redis
+from app.services.s3_service import generate_presigned_download_url, generate_presigned_get_url
+
+logger = logging.getLogger(__name__)
+
+# Entries kept in process memory before the least recently used one is dropped
+LOCAL_CACHE_SIZE = 4096
+
+
+class PresignedUrlCache:
+    """Reuses presigned GET URLs instead of signing a new one on every request.
+
+    A URL is handed out again as long as it stays valid for at least
+    PRESIGNED_URL_REUSE_MARGIN more seconds, so clients never receive a link
+    that is about to expire. Lookups go to process memory first, then to Redis
+    (shared by every API worker), and only sign on a miss. Repeated polls
+    therefore get the identical URL, which browsers and CDNs can cache.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, object_name: str, filename: str = None) -> str:
+        return f"presigned:{object_name}:{filename or ''}"
+
+    # Seconds a freshly signed URL may be reused
+    def reuse_ttl(self) -> int:
+        return max(PRESIGNED_URL_EXPIRATION - PRESIGNED_URL_REUSE_MARGIN, 0)
+
+    def _get_local(self, key: str):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            url, reuse_until = entry
+            if reuse_until <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return url
+
+    def _set_local(self, key: str, url: str, ttl: float):
+        with self._lock:
+            self._local[key] = (url, time.monotonic() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > LOCAL_CACHE_SIZE:
+                self._local.popitem(last=False)
+
+    def _sign(self, object_name: str, filename: str = None):
+        if filename:
+            return generate_presigned_download_url(object_name, filename, expiration=PRESIGNED_URL_EXPIRATION)
+        return generate_presigned_get_url(object_name, expiration=PRESIGNED_URL_EXPIRATION)
+
+    # Cached URLs for the given keys (None where there is none): process memory first, then one Redis round trip
+    async def _lookup(self, keys: list) -> list:
+        urls = [self._get_local(key) for key in keys]
+        missing = [i for i, url in enumerate(urls) if url is None]
+        if not missing:
+            return urls
+
+        try:
+            pipe = get_async_redis().pipeline(transaction=False)
+            for i in missing:
+                pipe.get(keys[i])
+                pipe.ttl(keys[i])
+            replies = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Presigned URL cache read failed: {e}")
+            return urls
+
+        for n, i in enumerate(missing):
+            url, ttl = replies[2 * n], replies[2 * n + 1]
+            if url and ttl and ttl > 0:
+                urls[i] = url
+                self._set_local(keys[i], url, ttl)
+        return urls
+
+    # A still reusable URL, without signing a new one on a miss
+    async def get_cached_url(self, object_name: str, filename: str = None):
+        urls = await self._lookup([self.key(object_name, filename)])
+        return urls[0]
+
+    # Presigned GET URL for object_name (with an attachment filename if given), reused while it is fresh
+    async def get_url(self, object_name: str, filename: str = None):
+        urls = await self.get_urls([(object_name, filename)])
+        return urls[0]
+
+    # Batch variant of get_url for (object_name, filename) pairs
+    async def get_urls(self, objects: list) -> list:
+        keys = [self.key(object_name, filename) for object_name, filename in objects]
+        urls = await self._lookup(keys)
+
+        signed = {}
+        for i, url in enumerate(urls):
+            if url:
+                continue
+            url = self._sign(*objects[i])
+            if url:
+                urls[i] = url
+                signed[keys[i]] = url
+                self._set_local(keys[i], url, self.reuse_ttl())
+
+        if signed and self.reuse_ttl():
+            try:
+                pipe = get_async_redis().pipeline(transaction=False)
+                for key, url in signed.items():
+                    pipe.set(key, url, ex=self.reuse_ttl())
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Presigned URL cache write failed: {e}")
+        return urls
+
+# A single instance which we can use globally
+presigned_url_cache = PresignedUrlCache()
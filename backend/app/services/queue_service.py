@@ -1,7 +1,8 @@
 from worker.tasks.transcode import transcode_video
 
-def enqueue_transcode_task(job_id:str,object_name:str):
+def enqueue_transcode_task(job_id:str,object_name:str,queue:str=None):
     transcode_video.apply_async(
         args=[job_id,object_name],
-        task_id=job_id
-    )   
\ No newline at end of file
+        task_id=job_id,
+        queue=queue
+    )
\ No newline at end of file
@@ -3,6 +3,7 @@ import boto3
 from botocore.exceptions import ClientError
 import json
 import logging
+from app.core.metrics import instrument_s3_client
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +28,12 @@ def get_s3_client():
     if _s3_client is None:
         if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
             raise ValueError("AWS credentials not configured. Set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY env vars.")
-        _s3_client = boto3.client(
+        _s3_client = instrument_s3_client(boto3.client(
             's3',
             region_name=AWS_REGION,
             aws_access_key_id=AWS_ACCESS_KEY_ID,
             aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-        )
+        ))
     return _s3_client
 
 # Backward compatibility: expose s3_client through property
@@ -89,13 +90,21 @@ def init_s3_bucket():
                         'ID': 'expire_input_videos',
                         'Filter': {'Prefix': 'input/'},
                         'Status': 'Enabled',
+                        'Expiration': {'Days': 1},
+                        'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1}
+                    },
+                    {
+                        'ID': 'expire_transcode_chunks',
+                        'Filter': {'Prefix': 'chunks/'},
+                        'Status': 'Enabled',
                         'Expiration': {'Days': 1}
                     },
                     {
                         'ID': 'expire_output_videos',
                         'Filter': {'Prefix': 'output/'},
                         'Status': 'Enabled',
-                        'Expiration': {'Days': 7}
+                        'Expiration': {'Days': 7},
+                        'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1}
                     }
                 ]
             }
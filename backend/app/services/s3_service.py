@@ -24,3 +24,60 @@ def generate_presigned_download_url(object_name: str, filename: str, expiration=
     except ClientError as e:
         print(f"Error generating pre-signed URL: {e}")
         return None
+
+
+# Plain GET URL without a download disposition, used for HLS playlists and segments played in the browser
+def generate_presigned_get_url(object_name: str, expiration=3600):
+    try:
+        response = s3_client.generate_presigned_url('get_object',
+                                                    Params={'Bucket': BUCKET_NAME,
+                                                            'Key': object_name},
+                                                    ExpiresIn=expiration)
+        return response
+    except ClientError as e:
+        print(f"Error generating pre-signed URL: {e}")
+        return None
+
+
+# Multipart upload helpers: the client PUTs parts directly to S3 with presigned URLs,
+# the API only starts, signs, inspects and completes/aborts the upload
+def create_multipart_upload(object_name: str):
+    response = s3_client.create_multipart_upload(Bucket=BUCKET_NAME, Key=object_name)
+    return response["UploadId"]
+
+
+def generate_presigned_part_urls(object_name: str, upload_id: str, part_numbers: list, expiration=3600):
+    return {
+        part_number: s3_client.generate_presigned_url('upload_part',
+                                                      Params={'Bucket': BUCKET_NAME,
+                                                              'Key': object_name,
+                                                              'UploadId': upload_id,
+                                                              'PartNumber': part_number},
+                                                      ExpiresIn=expiration)
+        for part_number in part_numbers
+    }
+
+
+# Parts S3 already has, so an interrupted client only re-sends the missing ones
+def list_uploaded_parts(object_name: str, upload_id: str):
+    parts = []
+    paginator = s3_client.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Key=object_name, UploadId=upload_id):
+        parts += [
+            {"part_number": part["PartNumber"], "etag": part["ETag"], "size": part["Size"]}
+            for part in page.get("Parts", [])
+        ]
+    return parts
+
+
+def complete_multipart_upload(object_name: str, upload_id: str, parts: list):
+    s3_client.complete_multipart_upload(
+        Bucket=BUCKET_NAME,
+        Key=object_name,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": [{"PartNumber": part["part_number"], "ETag": part["etag"]} for part in parts]}
+    )
+
+
+def abort_multipart_upload(object_name: str, upload_id: str):
+    s3_client.abort_multipart_upload(Bucket=BUCKET_NAME, Key=object_name, UploadId=upload_id)
@@ -0,0 +1,113 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.services.s3_client import s3_client, BUCKET_NAME
+
+logger = logging.getLogger(__name__)
+
+# S3 requires every part except the last one to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class MultipartUploadStream:
+    """File-like writer that uploads to S3 with a multipart upload as the data arrives.
+
+    Parts are sent in the background as soon as part_size bytes are buffered.
+    At most max_in_flight parts are uploading at a time; write() blocks while
+    that limit is reached. Memory use is therefore bounded to about
+    part_size * (max_in_flight + 1) bytes.
+    """
+
+    def __init__(self, object_name: str, part_size: int = 8 * 1024 * 1024, max_in_flight: int = 2, content_type: str = "video/mp4"):
+        self.object_name = object_name
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._buffer = bytearray()
+        self._parts = []
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._closed = False
+
+        response = s3_client.create_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=object_name,
+            ContentType=content_type
+        )
+        self.upload_id = response["UploadId"]
+
+    def _upload_part(self, part_number: int, data: bytes):
+        try:
+            response = s3_client.upload_part(
+                Bucket=BUCKET_NAME,
+                Key=self.object_name,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            self._slots.release()
+
+    def _submit(self, data: bytes):
+        # Surface a failed part as early as possible instead of at close()
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise future.exception()
+
+        self._slots.acquire()
+        part_number = len(self._futures) + 1
+        self._futures.append(self._executor.submit(self._upload_part, part_number, data))
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(part)
+
+    # Uploads the remaining buffer and completes the multipart upload. Returns the number of parts.
+    def close(self):
+        if self._closed:
+            return len(self._parts)
+        if self._buffer or not self._futures:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+
+        self._parts = [future.result() for future in self._futures]
+        self._executor.shutdown()
+        s3_client.complete_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=self.object_name,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self._parts}
+        )
+        self._closed = True
+        return len(self._parts)
+
+    # Drops everything uploaded so far so no orphaned parts keep costing storage
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        try:
+            s3_client.abort_multipart_upload(
+                Bucket=BUCKET_NAME,
+                Key=self.object_name,
+                UploadId=self.upload_id
+            )
+            logger.info(f"Aborted multipart upload of {self.object_name}")
+        except Exception as e:
+            logger.error(f"Could not abort multipart upload of {self.object_name}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,40 @@
+import logging
+from app.core.config import TRANSCODE_QUEUE_SHORT, TRANSCODE_QUEUE_LONG, SHORT_JOB_MAX_COST
+from worker.tasks.ffmpeg import RESOLUTIONS, STREAM_COPY
+
+logger = logging.getLogger(__name__)
+
+# Pixels of one 1080p frame, the unit of the cost estimate
+REFERENCE_PIXELS = 1920 * 1080
+
+
+# Output pixels per frame of one rung (a rung is never larger than the source, see build_ladder)
+def rung_pixels(res_name: str, width: int, height: int) -> float:
+    box_short, box_long = sorted(int(side) for side in RESOLUTIONS[res_name].split(":"))
+    source_short, source_long = sorted((width, height))
+    factor = min(1, box_short / source_short, box_long / source_long)
+    return width * height * factor * factor
+
+
+# Estimated encode cost of a job in seconds of 1080p output: duration x the pixels of every encoded rung.
+# Stream-copied rungs cost next to nothing. Returns None when the source could not be probed.
+def estimate_cost(source_info: dict, ladder: dict):
+    video = (source_info or {}).get("video")
+    duration = (source_info or {}).get("duration")
+    if not video or not video.get("width") or not video.get("height") or not duration:
+        return None
+
+    pixels = sum(
+        rung_pixels(res_name, video["width"], video["height"])
+        for res_name, res_scale in ladder.items()
+        if res_scale != STREAM_COPY
+    )
+    return duration * pixels / REFERENCE_PIXELS
+
+
+# Short jobs get their own queue (and worker pool) so they are not stuck behind long ones.
+# Jobs whose cost is unknown go to the long queue.
+def choose_queue(cost) -> str:
+    if cost is not None and cost <= SHORT_JOB_MAX_COST:
+        return TRANSCODE_QUEUE_SHORT
+    return TRANSCODE_QUEUE_LONG
@@ -0,0 +1,53 @@
+"""Local stand-ins for the external services, shared by the benchmark harnesses.
+
+Call start_s3() before importing any app module: the S3 client and the Celery
+app read their configuration on import.
+"""
+import logging
+import os
+import subprocess
+
+
+# In-process moto S3 server. boto3 picks it up through AWS_ENDPOINT_URL, so presigned URLs work over HTTP too.
+def start_s3():
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ["AWS_ENDPOINT_URL"] = f"http://{host}:{port}"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_REGION", "us-east-1")
+    os.environ.setdefault("AWS_BUCKET_NAME", "streamscale-benchmark")
+    return server
+
+
+# Without REDIS_URL, the Redis clients (sync and asyncio, sharing one fake server) and the Celery
+# broker/result backend stay in this process. Returns False when a real Redis is used.
+def use_local_redis():
+    if os.getenv("REDIS_URL"):
+        return False
+    import fakeredis
+    from app.core import redis_client
+    from app.core.celery_app import celery_app
+    server = fakeredis.FakeServer()
+    redis_client._redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_client._async_redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    celery_app.conf.update(broker_url="memory://", result_backend="cache+memory://")
+    return True
+
+
+def create_tables():
+    from app.db import models
+    from app.db.database import engine
+    from app.db.migrations import apply_schema_updates
+    models.Base.metadata.create_all(bind=engine)
+    apply_schema_updates(engine)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
@@ -0,0 +1,228 @@
+import csv
+import logging
+import subprocess
+import sys
+import time
+from celery import chord, group
+from celery.exceptions import Retry
+from contextlib import closing
+from app.core.celery_app import celery_app
+from app.core.chunk_store import chunk_store
+from app.core.config import CHUNK_DURATION
+from app.core.progress_store import progress_store
+from app.core.metrics import track_stage, observe_encode
+from app.db.database import sessionLocal
+from app.services.s3_client import s3_client, BUCKET_NAME
+from worker.tasks.ffmpeg import build_split_command, build_chunk_command, build_concat_command, run_ffmpeg
+from worker.tasks.resources import plan_rung, encode_slots
+from worker.tasks.transcode import has_audio_stream, publish_rendition, record_renditions_started, remove_temp_file, finish_job, check_redelivery, record_encode
+from worker.tasks.workspace import Workspace, InsufficientDiskSpace, job_workspace, reserve_or_defer, failure_retries_left, retry_failure
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+# S3 layout for intermediate chunks, removed once the job is assembled
+def chunk_prefix(job_id: str) -> str:
+    return f"chunks/{job_id}/"
+
+def source_chunk_key(job_id: str, index: int) -> str:
+    return f"{chunk_prefix(job_id)}source/{index:04d}.mkv"
+
+def encoded_chunk_key(job_id: str, res_name: str, index: int) -> str:
+    return f"{chunk_prefix(job_id)}{res_name}/{index:04d}.mp4"
+
+def audio_key(job_id: str) -> str:
+    return f"{chunk_prefix(job_id)}audio.mka"
+
+
+# Splits the input at keyframes into the job's workspace, uploads the chunks (and the audio track) to S3
+# and returns the chord that encodes every chunk of every rendition in parallel.
+# The local chunks go away with the workspace once transcode_video hands the job over.
+# completed holds the entries of renditions an earlier attempt already finished; they are not encoded again.
+def prepare_chunked(job_id: str, workspace: Workspace, input_path: str, total_duration: float, ladder: dict, plans: dict, queue: str = None, completed: dict = None):
+    chunk_pattern = workspace.file("chunk_%04d.mkv")
+    segment_list = workspace.file("chunks.csv")
+    audio_path = workspace.file("audio.mka") if has_audio_stream(input_path) else None
+
+    cmd = build_split_command(input_path, chunk_pattern, segment_list, CHUNK_DURATION, audio_path)
+    logger.info(f"Splitting {job_id} into chunks: {' '.join(cmd)}")
+    subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+    chunks = []
+    with open(segment_list, newline="") as f:
+        for index, (_, start, end) in enumerate(csv.reader(f)):
+            chunk_path = chunk_pattern % index
+            s3_client.upload_file(chunk_path, BUCKET_NAME, source_chunk_key(job_id, index))
+            remove_temp_file(chunk_path)
+            chunks.append(float(end) - float(start))
+
+    if audio_path:
+        s3_client.upload_file(audio_path, BUCKET_NAME, audio_key(job_id))
+
+    if not chunks:
+        raise Exception(f"Splitting {job_id} produced no chunks")
+    logger.info(f"Job {job_id} split into {len(chunks)} chunks")
+    record_renditions_started(job_id, list(ladder.keys()))
+
+    header = group([
+        encode_chunk.s(job_id, res_name, res_scale, index, duration, total_duration, plans[res_name]).set(queue=queue)
+        for res_name,res_scale in ladder.items()
+        for index, duration in enumerate(chunks)
+    ])
+    return chord(header, assemble_chunks.s(job_id, list(ladder.keys()), len(chunks), audio_path is not None, completed).set(queue=queue))
+
+
+# Encodes one chunk of one rendition. Every chunk retries on its own; chunks already
+# encoded (according to chunk_store) are skipped, so a retry never redoes finished work.
+@celery_app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=30,
+    task_time_limit=30 * 60,
+    soft_time_limit=25 * 60,
+    acks_late=True,
+    reject_on_worker_lost=True
+    )
+def encode_chunk(self, job_id: str, res_name: str, res_scale: str, index: int, duration: float, total_duration: float, plan: dict = None):
+    result = {"res":res_name,"index":index,"status":"COMPLETED","error":None}
+    if chunk_store.get_status(job_id, res_name, index) == "COMPLETED":
+        logger.info(f"Chunk {index} of {job_id}_{res_name} already encoded, skipping")
+        return result
+
+    workspace = job_workspace(job_id, f"chunk{index:04d}_{res_name}")
+    input_path = workspace.file("chunk.mkv")
+    output_path = workspace.file(f"chunk_{res_name}.mp4")
+    try:
+        check_redelivery(self)
+        # Chunks are small, so only the free-space floor is checked before taking one
+        reserve_or_defer(self, workspace)
+        with track_stage("chunk_download", res_name):
+            s3_client.download_file(BUCKET_NAME, source_chunk_key(job_id, index), input_path)
+        plan = plan or plan_rung(res_name, res_scale)
+        with encode_slots(plan["slots"], res_name):
+            started = time.perf_counter()
+            run_ffmpeg(build_chunk_command(input_path, res_scale, output_path, plan["threads"]))
+            seconds = time.perf_counter() - started
+            observe_encode(res_name, seconds, duration)
+        record_encode(job_id, res_name, "chunked", [plan], duration, seconds)
+        with track_stage("chunk_upload", res_name):
+            s3_client.upload_file(output_path, BUCKET_NAME, encoded_chunk_key(job_id, res_name, index))
+
+        done_seconds = chunk_store.mark_completed(job_id, res_name, index, duration)
+        percent = max(0, min(99, int(done_seconds / total_duration * 100)))
+        progress_store.set_rendition(job_id, res_name, {"progress":percent,"status":"PROCESSING","error":None})
+        return result
+
+    except Retry:
+        raise
+
+    except Exception as e:
+        logger.error(f"Chunk {index} of {job_id}_{res_name} failed: {e}")
+        # A chunk deferred for disk space too often is not retried as a failure on top
+        if not isinstance(e, InsufficientDiskSpace) and failure_retries_left(self):
+            raise retry_failure(self, e)
+        # Out of retries: report the failure so the chord callback still runs
+        chunk_store.mark_failed(job_id, res_name, index)
+        result.update({"status":"FAILED","error":str(e)})
+        return result
+
+    finally:
+        workspace.teardown()
+
+
+# Joins the encoded chunks of one rendition into output/{job_id}_{res_name}.mp4
+def concat_rendition(job_id: str, workspace: Workspace, res_name: str, chunk_count: int, entry: dict, audio_path: str = None):
+    output_path = workspace.file(f"output_{res_name}.mp4")
+    concat_list = workspace.file(f"concat_{res_name}.txt")
+    chunk_paths = [workspace.file(f"part_{res_name}_{index:04d}.mp4") for index in range(chunk_count)]
+
+    try:
+        for index, chunk_path in enumerate(chunk_paths):
+            s3_client.download_file(BUCKET_NAME, encoded_chunk_key(job_id, res_name, index), chunk_path)
+
+        with open(concat_list, "w") as f:
+            f.writelines(f"file '{chunk_path}'\n" for chunk_path in chunk_paths)
+
+        subprocess.run(build_concat_command(concat_list, output_path, audio_path), capture_output=True, text=True, check=True)
+        publish_rendition(job_id, res_name, output_path, entry)
+
+    finally:
+        for chunk_path in chunk_paths:
+            remove_temp_file(chunk_path)
+        remove_temp_file(concat_list)
+        remove_temp_file(output_path)
+
+
+# Removes every intermediate object under chunks/{job_id}/
+def delete_chunk_objects(job_id: str):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=chunk_prefix(job_id)):
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if keys:
+            s3_client.delete_objects(Bucket=BUCKET_NAME, Delete={"Objects": keys, "Quiet": True})
+
+
+# Chord callback: concatenates every rendition whose chunks all succeeded and finalizes the job
+@celery_app.task(
+    bind=True,
+    task_time_limit=30 * 60,
+    soft_time_limit=25 * 60,
+    acks_late=True,
+    reject_on_worker_lost=True
+    )
+def assemble_chunks(self, results: list, job_id: str, res_names: list, chunk_count: int, has_audio: bool, completed: dict = None):
+    progress_tracker = {res:{"progress":0,"status":"PROCESSING","error":None} for res in res_names}
+    for result in results:
+        if result["status"] == "FAILED":
+            progress_tracker[result["res"]].update({"status":"FAILED","error":f"chunk {result['index']}: {result['error']}"})
+
+    workspace = job_workspace(job_id, "assemble")
+    audio_path = workspace.file("audio.mka") if has_audio else None
+    try:
+        # Renditions are joined one at a time and their parts removed right after, so only the floor is checked
+        reserve_or_defer(self, workspace)
+        if audio_path:
+            s3_client.download_file(BUCKET_NAME, audio_key(job_id), audio_path)
+
+        for res_name,data in progress_tracker.items():
+            if data["status"] == "FAILED":
+                progress_store.set_rendition(job_id, res_name, data)
+                continue
+            try:
+                concat_rendition(job_id, workspace, res_name, chunk_count, data, audio_path)
+                data.update({"progress":100,"status":"COMPLETED"})
+            except Exception as e:
+                logger.error(f"Failed assembling {res_name} for job {job_id}:{e}")
+                data.update({"status":"FAILED","error":str(e)})
+            progress_store.set_rendition(job_id, res_name, data)
+
+    except InsufficientDiskSpace as e:
+        # Deferred too often: the renditions fail, and the job is finalized (and its state published) below
+        logger.error(f"Could not assemble job {job_id}: {e}")
+        for res_name,data in progress_tracker.items():
+            if data["status"] != "FAILED":
+                data.update({"status":"FAILED","error":str(e)})
+                progress_store.set_rendition(job_id, res_name, data)
+
+    finally:
+        workspace.teardown()
+
+    # Intermediate chunks are only kept around for retries of failed renditions
+    if all(data["status"] == "COMPLETED" for data in progress_tracker.values()):
+        try:
+            delete_chunk_objects(job_id)
+            chunk_store.clear(job_id)
+        except Exception as e:
+            logger.warning(f"Could not remove chunk objects for {job_id}: {e}")
+
+    # Renditions finished before the chunks were split (see prepare_chunked)
+    progress_tracker.update(completed or {})
+    with closing(sessionLocal()) as db:
+        return finish_job(self, db, job_id, progress_tracker)
@@ -1,12 +1,19 @@
-import os
 import logging
 import sys
 from datetime import datetime, timedelta
 from contextlib import closing
-from sqlalchemy import text
+from sqlalchemy import text, tuple_
+from sqlalchemy.exc import OperationalError
 from app.core.celery_app import celery_app
+from app.core.config import CLEANUP_BATCH_SIZE, CLEANUP_LOCK_TIMEOUT_MS, ENCODE_STATS_RETENTION_DAYS
+from app.core.encode_stat_store import encode_stat_store
+from app.core.job_cache import job_cache
+from app.core.metrics import CLEANUP_JOBS_DELETED, CLEANUP_OBJECTS_DELETED, CLEANUP_ERRORS, CLEANUP_BATCH_SECONDS
 from app.db.database import sessionLocal
-from app.db.models import Job
+from app.db.models import Job, Rendition
+from app.services.s3_client import s3_client, BUCKET_NAME
+from worker.tasks.ffmpeg import RESOLUTIONS
+from worker.tasks.workspace import sweep_orphans
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -16,62 +23,155 @@ handler.setFormatter(formatter)
 if not logger.handlers:
     logger.addHandler(handler)
 
-TEMP_DIR = "/tmp"
+
+# Finished jobs are kept this long before their rows and S3 objects are purged
+RETENTION = [
+    (("SUCCESS", "COMPLETED", "PARTIAL_SUCCESS"), timedelta(days=7)),
+    (("FAILED",), timedelta(days=3)),
+]
+
+# S3 accepts at most 1000 keys per DeleteObjects request
+DELETE_OBJECTS_LIMIT = 1000
+
+# SQLSTATE of a statement cancelled by lock_timeout (lock_not_available)
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+# Every S3 object of a job: the upload, the MP4 renditions and the HLS tree under output/{job_id}/
+def job_object_keys(job, rendition_objects: list) -> list:
+    keys = {job.input_object_name, *rendition_objects}
+    # Jobs from before the renditions table (or with failed rungs) may still have the default names
+    keys.update(f"output/{job.job_id}_{res_name}.mp4" for res_name in set(job.resolutions or []) | set(RESOLUTIONS))
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=f"output/{job.job_id}/"):
+        keys.update(obj["Key"] for obj in page.get("Contents", []))
+    return sorted(keys)
+
+
+# Deletes keys with batched DeleteObjects calls; returns (deleted count, keys that failed)
+def delete_keys(keys: list):
+    deleted, failed = 0, set()
+    for start in range(0, len(keys), DELETE_OBJECTS_LIMIT):
+        batch = keys[start:start + DELETE_OBJECTS_LIMIT]
+        response = s3_client.delete_objects(
+            Bucket=BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        )
+        errors = {error["Key"] for error in response.get("Errors", [])}
+        failed |= errors
+        deleted += len(batch) - len(errors)
+    return deleted, failed
+
+
+# Purges one batch of expired jobs: S3 objects first, then the rows (renditions go with them through the
+# foreign key). Jobs whose objects could not all be deleted keep their row and are retried on the next run.
+def purge_batch(db, jobs: list, status: str) -> tuple:
+    job_ids = [job.job_id for job in jobs]
+    rendition_objects = {job_id: [] for job_id in job_ids}
+    for job_id, object_name in db.query(Rendition.job_id, Rendition.object_name).filter(Rendition.job_id.in_(job_ids), Rendition.object_name.isnot(None)):
+        rendition_objects[job_id].append(object_name)
+    # Nothing stays open while S3 is called
+    db.commit()
+
+    keys_by_job = {job.job_id: job_object_keys(job, rendition_objects[job.job_id]) for job in jobs}
+    deleted_objects, failed_keys = delete_keys([key for keys in keys_by_job.values() for key in keys])
+    purged = [job_id for job_id, keys in keys_by_job.items() if not failed_keys.intersection(keys)]
+    if failed_keys:
+        CLEANUP_ERRORS.labels(kind="s3").inc(len(failed_keys))
+        logger.warning(f"Could not delete {len(failed_keys)} objects, keeping {len(jobs) - len(purged)} jobs for the next run")
+
+    if purged:
+        try:
+            if db.bind.dialect.name == "postgresql":
+                # A batch never waits long behind other writers; the next run picks it up again
+                db.execute(text(f"SET LOCAL lock_timeout = '{CLEANUP_LOCK_TIMEOUT_MS}ms'"))
+            db.query(Job).filter(Job.job_id.in_(purged)).delete(synchronize_session=False)
+            db.commit()
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                raise
+            # Only this batch is given up: its rows stay (their objects are gone, deleting them again is a no-op)
+            # and the run goes on with the next keyset page
+            db.rollback()
+            CLEANUP_ERRORS.labels(kind="lock").inc()
+            logger.warning(f"Cleanup: lock timeout deleting {len(purged)} {status} jobs, keeping them for the next run")
+            purged = []
+        for job_id in purged:
+            job_cache.invalidate(str(job_id))
+
+    CLEANUP_JOBS_DELETED.labels(status=status).inc(len(purged))
+    CLEANUP_OBJECTS_DELETED.inc(deleted_objects)
+    return len(purged), deleted_objects
 
 
 @celery_app.task(bind=True, max_retries=3, default_retry_delay=300)
 def cleanup_old_jobs(self):
     """
-    Cleanup old job records from PostgreSQL database.
-    
-    Deletes:
+    Purge expired jobs from PostgreSQL and S3.
+
+    Deletes, with their input and output objects:
     - Completed jobs older than 7 days
     - Failed jobs older than 3 days
+
+    Encode statistics are not tied to jobs; they are kept ENCODE_STATS_RETENTION_DAYS.
+
+    Walks the (status, created_at) index in keyset order, CLEANUP_BATCH_SIZE jobs
+    per batch, each batch in its own short transaction.
     """
+    now = datetime.utcnow()
+    deleted = {}
+    total_objects = 0
     try:
         with closing(sessionLocal()) as db:
-            now = datetime.utcnow()
-            
-            # Calculate cutoff dates
-            completed_cutoff = now - timedelta(days=7)
-            failed_cutoff = now - timedelta(days=3)
-            
-            # Delete completed jobs older than 7 days
-            completed_query = db.query(Job).filter(
-                Job.status.in_(['SUCCESS', 'COMPLETED', 'PARTIAL_SUCCESS']),
-                Job.created_at < completed_cutoff
-            )
-            completed_count = completed_query.count()
-            completed_query.delete(synchronize_session=False)
-            
-            # Delete failed jobs older than 3 days
-            failed_query = db.query(Job).filter(
-                Job.status.in_(['FAILED']),
-                Job.created_at < failed_cutoff
-            )
-            failed_count = failed_query.count()
-            failed_query.delete(synchronize_session=False)
-            
-            # Commit the deletions
-            db.commit()
-            
-            total_deleted = completed_count + failed_count
-            logger.info(
-                f"Database cleanup completed: "
-                f"{completed_count} completed jobs (>7 days), "
-                f"{failed_count} failed jobs (>3 days) deleted. "
-                f"Total: {total_deleted}"
-            )
-            
-            return {
-                "status": "success",
-                "completed_deleted": completed_count,
-                "failed_deleted": failed_count,
-                "total_deleted": total_deleted,
-                "timestamp": now.isoformat()
-            }
-            
+            for statuses, retention in RETENTION:
+                cutoff = now - retention
+                for status in statuses:
+                    deleted[status] = 0
+                    # Keyset cursor: rows kept back after an S3 error are skipped, not selected again
+                    cursor = None
+                    while True:
+                        query = db.query(Job.job_id, Job.created_at, Job.input_object_name, Job.resolutions).filter(
+                            Job.status == status, Job.created_at < cutoff
+                        )
+                        if cursor:
+                            query = query.filter(tuple_(Job.created_at, Job.job_id) > cursor)
+                        jobs = query.order_by(Job.created_at, Job.job_id).limit(CLEANUP_BATCH_SIZE).all()
+                        if not jobs:
+                            break
+                        cursor = (jobs[-1].created_at, jobs[-1].job_id)
+
+                        with CLEANUP_BATCH_SECONDS.time():
+                            purged, objects = purge_batch(db, jobs, status)
+                        deleted[status] += purged
+                        total_objects += objects
+                        logger.info(f"Cleanup: purged {purged}/{len(jobs)} {status} jobs and {objects} objects in this batch")
+
+            stats_deleted = encode_stat_store.delete_before(db, now - timedelta(days=ENCODE_STATS_RETENTION_DAYS))
+
+        total_deleted = sum(deleted.values())
+        completed_count = total_deleted - deleted.get("FAILED", 0)
+        failed_count = deleted.get("FAILED", 0)
+        logger.info(
+            f"Database cleanup completed: "
+            f"{completed_count} completed jobs (>7 days), "
+            f"{failed_count} failed jobs (>3 days) deleted, "
+            f"{total_objects} S3 objects removed, "
+            f"{stats_deleted} encode stats expired. "
+            f"Total: {total_deleted}"
+        )
+
+        return {
+            "status": "success",
+            "completed_deleted": completed_count,
+            "failed_deleted": failed_count,
+            "total_deleted": total_deleted,
+            "objects_deleted": total_objects,
+            "encode_stats_deleted": stats_deleted,
+            "timestamp": now.isoformat()
+        }
+
     except Exception as e:
+        CLEANUP_ERRORS.labels(kind="run").inc()
         logger.error(f"Database cleanup failed: {e}")
         raise self.retry(exc=e)
 
@@ -79,62 +179,32 @@ def cleanup_old_jobs(self):
 @celery_app.task(bind=True, max_retries=2, default_retry_delay=60)
 def cleanup_orphaned_temp_files(self):
     """
-    Cleanup temporary files in /tmp directory.
-    
-    Removes:
-    - Files older than 24 hours matching job patterns (input/output videos)
-    - Partial/unfinished ffmpeg outputs
-    
+    Remove orphaned scratch workspaces under WORKSPACE_ROOT.
+
+    Every task writes only inside its own workspace directory and removes it when it finishes,
+    so anything still there belongs to a task that died: its process on this host has exited,
+    or the workspace is older than WORKSPACE_MAX_AGE_HOURS. Admission control runs the same
+    sweep whenever a new workspace does not fit.
+
     This is a safety net in case worker cleanup failed.
     """
     try:
         now = datetime.utcnow()
-        cutoff_time = now - timedelta(hours=24)
-        
-        cleaned_count = 0
-        cleaned_size = 0
-        
-        # Patterns for temp files we create
-        temp_patterns = [
-            '_input',      # Downloaded input files
-            '_360.mp4',    # Transcoded outputs
-            '_720.mp4',
-            '_1080.mp4',
-        ]
-        
-        for filename in os.listdir(TEMP_DIR):
-            filepath = os.path.join(TEMP_DIR, filename)
-            
-            # Check if file matches our patterns and is old enough
-            if any(pattern in filename for pattern in temp_patterns):
-                try:
-                    stat = os.stat(filepath)
-                    file_mtime = datetime.fromtimestamp(stat.st_mtime)
-                    
-                    if file_mtime < cutoff_time:
-                        file_size = stat.st_size
-                        os.remove(filepath)
-                        cleaned_count += 1
-                        cleaned_size += file_size
-                        logger.info(f"Cleaned orphaned temp file: {filename} ({file_size} bytes)")
-                        
-                except (OSError, IOError) as e:
-                    logger.warning(f"Could not remove temp file {filename}: {e}")
-                    continue
-        
+        cleaned_count, cleaned_size = sweep_orphans()
+
         logger.info(
-            f"Temp file cleanup completed: "
-            f"{cleaned_count} files removed, "
+            f"Workspace cleanup completed: "
+            f"{cleaned_count} workspaces removed, "
             f"{cleaned_size / (1024*1024):.2f} MB freed"
         )
-        
+
         return {
             "status": "success",
-            "files_cleaned": cleaned_count,
+            "workspaces_cleaned": cleaned_count,
             "bytes_freed": cleaned_size,
             "timestamp": now.isoformat()
         }
-        
+
     except Exception as e:
-        logger.error(f"Temp file cleanup failed: {e}")
+        logger.error(f"Workspace cleanup failed: {e}")
         raise self.retry(exc=e)
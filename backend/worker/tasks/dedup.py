@@ -0,0 +1,115 @@
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from app.core.config import ABR_PACKAGING
+from app.core.job_store import job_store
+from app.core.rendition_store import rendition_store
+from app.services.s3_client import s3_client, BUCKET_NAME
+from worker.tasks.ladder import build_ladder
+from worker.tasks.packaging import hls_prefix, master_playlist_key
+from worker.tasks.transcode import record_rendition_completed
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+COPY_WORKERS = 8
+
+
+# Fingerprint of an uploaded source: its S3 ETag plus size. The ETag is the MD5 for single-part uploads;
+# multipart ETags depend on the part size, which the upload API derives from the file size, so a
+# re-upload of the same file produces the same fingerprint either way.
+def source_fingerprint(object_name: str) -> str:
+    head = s3_client.head_object(Bucket=BUCKET_NAME, Key=object_name)
+    etag = head["ETag"].strip('"')
+    return f"{etag}:{head['ContentLength']}"
+
+
+# Whether a job's outputs include an HLS master playlist
+def _has_master_playlist(job_id: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=BUCKET_NAME, Key=master_playlist_key(job_id))
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def _copy_object(source_key: str, target_key: str):
+    # Managed copy: server side, and switches to multipart copy for objects over 5 GB
+    s3_client.copy({"Bucket": BUCKET_NAME, "Key": source_key}, BUCKET_NAME, target_key)
+
+
+# Copies every output of source_job_id to job_id inside S3 (no re-encode, no data through the worker)
+# and records the renditions. Returns the master playlist key if the source job was packaged as HLS.
+def copy_job_outputs(db, source_job_id: str, job_id: str, progress_tracker: dict):
+    renditions = {r.name: r for r in rendition_store.get_renditions(db, source_job_id)}
+
+    for res_name, entry in progress_tracker.items():
+        source = renditions[res_name]
+        target_key = f"output/{job_id}_{res_name}.mp4"
+        _copy_object(source.object_name, target_key)
+        record_rendition_completed(job_id, res_name, target_key, source.duration)
+        entry.update({"progress":100,"status":"COMPLETED","error":None})
+
+    # HLS playlists use relative URIs, so the whole output/{job_id}/ tree can be copied as is
+    source_prefix = hls_prefix(source_job_id)
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=source_prefix):
+        keys += [obj["Key"] for obj in page.get("Contents", [])]
+    if not keys:
+        return None
+
+    # Master playlist last, so it never points at variants that are not there yet
+    master = master_playlist_key(source_job_id)
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+        list(pool.map(
+            lambda key: _copy_object(key, hls_prefix(job_id) + key[len(source_prefix):]),
+            [key for key in keys if key != master]
+        ))
+    if master in keys:
+        _copy_object(master, master_playlist_key(job_id))
+        return master_playlist_key(job_id)
+    return None
+
+
+# Fingerprints the job's source and, if an identical upload already finished with the ladder (and, with HLS
+# packaging, the HLS outputs) the current settings would produce, reuses its outputs. Returns
+# (progress_tracker, master_playlist), or (None, None) when the job has to be encoded; any failure falls back
+# to a normal encode.
+def reuse_duplicate_outputs(db, job_id: str, object_name: str):
+    try:
+        fingerprint = source_fingerprint(object_name)
+        job_store.set_fingerprint(db, job_id, fingerprint)
+        duplicate = job_store.find_completed_duplicate(db, job_id, fingerprint)
+        if not duplicate:
+            return None, None
+
+        # Same source, so the same probe result; only a changed ladder configuration makes the outputs differ.
+        # Rung names alone are not enough: the scale of a rung or whether it is stream-copied may differ too.
+        ladder = build_ladder(duplicate.source_info)
+        if ladder != (duplicate.ladder or {}):
+            logger.info(f"Job {duplicate.job_id} has the same source as {job_id} but a different ladder")
+            return None, None
+        # A job encoded without HLS packaging has no variants to copy; with packaging on it would finish without them
+        if ABR_PACKAGING == "hls" and not _has_master_playlist(str(duplicate.job_id)):
+            logger.info(f"Job {duplicate.job_id} has the same source as {job_id} but was not packaged as HLS")
+            return None, None
+
+        logger.info(f"Job {job_id} has the same source as {duplicate.job_id}, copying its outputs")
+        job_store.set_source_info(db, job_id, duplicate.source_info, ladder)
+        progress_tracker = {res:{"progress":0,"status":"QUEUED","error":None} for res in ladder}
+        master_playlist = copy_job_outputs(db, str(duplicate.job_id), job_id, progress_tracker)
+        return progress_tracker, master_playlist
+
+    except Exception as e:
+        logger.warning(f"Could not reuse outputs for job {job_id}, encoding instead: {e}")
+        return None, None
@@ -0,0 +1,129 @@
+import logging
+import sys
+import time
+from celery import chord, group
+from celery.exceptions import Retry
+from contextlib import closing
+from app.core.celery_app import celery_app
+from app.core.progress_store import progress_store
+from app.core.metrics import track_stage, observe_encode
+from app.db.database import sessionLocal
+from worker.tasks.ffmpeg import build_rendition_command, run_ffmpeg
+from worker.tasks.progress import ProgressReporter
+from worker.tasks.resources import plan_rung, encode_slots
+from worker.tasks.transcode import fetch_source, open_output, publish_rendition, record_renditions_started, finish_job, completed_renditions, check_redelivery, record_encode
+from worker.tasks.workspace import job_workspace, reserve_or_defer, failure_retries_left, retry_failure
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+# Builds the chord for a job: one encode subtask per rendition, then finalize_transcode once all of them are done.
+# workspace_bytes is the predicted scratch usage of every subtask, checked by admission control on its worker,
+# and plans the encoder threads and slots of every rung (see worker.tasks.resources).
+# completed holds the entries of renditions an earlier attempt already finished; they are not encoded again.
+def build_fanout(job_id: str, object_name: str, total_duration: float, ladder: dict, queue: str = None, workspace_bytes: dict = None, plans: dict = None, completed: dict = None):
+    workspace_bytes = workspace_bytes or {}
+    plans = plans or {}
+    header = group([
+        encode_rendition.s(job_id, object_name, res_name, res_scale, total_duration, workspace_bytes.get(res_name, 0), plans.get(res_name)).set(queue=queue)
+        for res_name,res_scale in ladder.items()
+    ])
+    return chord(header, finalize_transcode.s(job_id, completed).set(queue=queue))
+
+
+# Encodes a single rendition. Failures are returned instead of raised so the chord callback always runs.
+@celery_app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    task_time_limit=30 * 60,
+    soft_time_limit=25 * 60,
+    acks_late=True,
+    reject_on_worker_lost=True
+    )
+def encode_rendition(self, job_id: str, object_name: str, res_name: str, res_scale: str, total_duration: float, workspace_bytes: int = 0, plan: dict = None):
+    entry = {"progress":0,"status":"QUEUED","error":None}
+    # Subtasks can land on different nodes, so every one of them reads the source from S3 on its own
+    workspace = job_workspace(job_id, res_name)
+    stream = None
+
+    try:
+        # Database and Redis errors here are retried like a failed download
+        try:
+            # Redelivered after the rendition was already uploaded: nothing left to do
+            with closing(sessionLocal()) as db:
+                done = completed_renditions(db, job_id, {res_name: res_scale}).get(res_name)
+            if done:
+                return {"res":res_name, **done}
+            progress_store.set_rendition(job_id, res_name, entry)
+        except Exception as e:
+            logger.error(f"Could not prepare {res_name} for job {job_id}: {e}")
+            if failure_retries_left(self):
+                raise retry_failure(self, e, countdown=60)
+            raise
+
+        check_redelivery(self)
+        reserve_or_defer(self, workspace, workspace_bytes)
+        try:
+            with track_stage("download", res_name):
+                input_path = fetch_source(workspace, object_name)
+        except Exception as e:
+            logger.error(f"Failed to download object {object_name} from S3 for {res_name}: {e}")
+            if failure_retries_left(self):
+                raise retry_failure(self, e, countdown=60)
+            raise
+
+        record_renditions_started(job_id, [res_name])
+        output_path, stream = open_output(workspace, job_id, res_name)
+        plan = plan or plan_rung(res_name, res_scale)
+        cmd = build_rendition_command(input_path, res_scale, output_path, plan["threads"])
+        logger.info(f"Running FFmpeg command for {res_name}: {' '.join(cmd)}")
+        with encode_slots(plan["slots"], res_name):
+            started = time.perf_counter()
+            run_ffmpeg(cmd, ProgressReporter(job_id, {res_name: entry}, total_duration), streams=[stream] if stream else ())
+            seconds = time.perf_counter() - started
+            observe_encode(res_name, seconds, total_duration)
+        record_encode(job_id, res_name, "fanout", [plan], total_duration, seconds)
+
+        publish_rendition(job_id, res_name, output_path, entry, stream, total_duration)
+        entry.update({"progress":100,"status":"COMPLETED"})
+
+    except Retry:
+        # Let Celery reschedule; the chord waits for the retried subtask
+        raise
+
+    except Exception as e:
+        logger.error(f"Failed processing {res_name} for job {job_id}:{e}")
+        entry.update({"status":"FAILED","error":str(e)})
+        if stream:
+            stream.abort()
+
+    finally:
+        workspace.teardown()
+
+    try:
+        progress_store.set_rendition(job_id, res_name, entry)
+    except Exception as e:
+        # The result still reaches the chord callback, which decides the job status
+        logger.warning(f"Could not report {res_name} of job {job_id}: {e}")
+    return {"res":res_name, **entry}
+
+
+# Chord callback: runs with the original job id, so its result is what the status endpoint sees.
+# completed are the renditions finished before the chord started (see build_fanout).
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def finalize_transcode(self, results: list, job_id: str, completed: dict = None):
+    progress_tracker = dict(completed or {})
+    progress_tracker.update({
+        result["res"]: {key:value for key,value in result.items() if key != "res"}
+        for result in results
+    })
+    with closing(sessionLocal()) as db:
+        return finish_job(self, db, job_id, progress_tracker)
@@ -1,4 +1,6 @@
 import os
+import subprocess
+from app.core.config import ABR_PACKAGING, HLS_SEGMENT_DURATION, HLS_SEGMENT_TYPE
 
 DEFAULT_RESOLUTIONS = {
     "360":"640:360",
@@ -18,4 +20,256 @@ def parse_resolutions(env_str=None):
             resolutions[name] = f"{width}:{height}"
     return resolutions if resolutions else DEFAULT_RESOLUTIONS
 
-RESOLUTIONS = parse_resolutions(os.getenv("TRANSCODE_RESOLUTIONS"))
\ No newline at end of file
+RESOLUTIONS = parse_resolutions(os.getenv("TRANSCODE_RESOLUTIONS"))
+
+# Ladder entries are the arguments of the scale filter, or STREAM_COPY for a rung the source
+# already matches exactly: its video stream is copied instead of re-encoded (see worker.tasks.ladder)
+STREAM_COPY = "copy"
+
+# Keyframe placement for ABR packaging: a forced keyframe on every segment boundary and no
+# scene-cut keyframes, so every rendition can be segmented at exactly the same timestamps
+def _gop_args():
+    if ABR_PACKAGING != "hls":
+        return []
+    return [
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_DURATION})",
+        "-sc_threshold", "0",
+    ]
+
+
+# Encoder threads when the caller has no plan from the resource governor (worker.tasks.resources)
+DEFAULT_ENCODE_THREADS = 2
+
+# Encoder settings shared by every rendition so single-pass and per-rendition outputs match
+def _encoder_args(res_scale: str = None, threads: int = DEFAULT_ENCODE_THREADS):
+    if res_scale == STREAM_COPY:
+        return [
+            "-c:v", "copy",
+            "-c:a", "copy",
+            "-max_muxing_queue_size", "1024",
+        ]
+    return [
+        "-c:v", "libx264",
+        "-c:a", "copy",
+        "-preset", "veryfast",
+        "-threads", str(threads),     # Sized per rung by the resource governor
+        "-max_muxing_queue_size", "1024",  # Prevent buffering overflow
+        *_gop_args(),
+    ]
+
+
+# Inputs read over HTTP (presigned S3 URLs) reconnect and resume with range requests after a dropped connection
+def _input_args(input_path: str):
+    if input_path.startswith(("http://", "https://")):
+        return [
+            "-reconnect", "1",
+            "-reconnect_streamed", "1",
+            "-reconnect_on_network_error", "1",
+            "-reconnect_delay_max", "5",
+            "-i", input_path
+        ]
+    return ["-i", input_path]
+
+
+# Streamed outputs ("pipe:N") cannot seek back to write the moov atom, so they are muxed as fragmented MP4.
+# Files get the moov atom moved to the front, so players can start before the whole file has arrived.
+def _output_args(output_path: str):
+    if output_path.startswith("pipe:"):
+        return ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", output_path]
+    return ["-movflags", "+faststart", output_path]
+
+
+def _scale_args(res_scale: str):
+    return [] if res_scale == STREAM_COPY else ["-vf", f"scale={res_scale}"]
+
+
+# One ffmpeg run per rendition, the input is decoded again for every rung
+def build_rendition_command(input_path: str, res_scale: str, output_path: str, threads: int = DEFAULT_ENCODE_THREADS):
+    return [
+        "ffmpeg",
+        "-y",
+        *_input_args(input_path),
+        *_scale_args(res_scale),
+        *_encoder_args(res_scale, threads),
+        "-progress", "pipe:1",
+        *_output_args(output_path)
+    ]
+
+
+# One ffmpeg run for the whole ladder: the input is decoded once and split into a scaler per rung.
+# outputs maps res_name -> (res_scale, output_path); output_path may be a "pipe:N" target.
+# threads maps res_name -> encoder threads of that output.
+# Stream-copied rungs bypass the filter graph and map the source video directly.
+def build_single_pass_command(input_path: str, outputs: dict, threads: dict = None):
+    scaled = [res_scale for res_scale, _ in outputs.values() if res_scale != STREAM_COPY]
+    labels = [f"s{i}" for i in range(len(scaled))]
+    filters = [f"[0:v]split={len(scaled)}" + "".join(f"[{label}]" for label in labels)] if scaled else []
+    output_args = []
+    scaler = 0
+
+    for res_name, (res_scale, output_path) in outputs.items():
+        if res_scale == STREAM_COPY:
+            video_map = "0:v:0"
+        else:
+            filters.append(f"[{labels[scaler]}]scale={res_scale}[v{scaler}]")
+            video_map = f"[v{scaler}]"
+            scaler += 1
+        output_args += [
+            "-map", video_map,
+            "-map", "0:a?",
+            *_encoder_args(res_scale, (threads or {}).get(res_name, DEFAULT_ENCODE_THREADS)),
+            *_output_args(output_path)
+        ]
+
+    return [
+        "ffmpeg",
+        "-y",
+        *_input_args(input_path),
+        *(["-filter_complex", ";".join(filters)] if filters else []),
+        "-progress", "pipe:1",
+        *output_args
+    ]
+
+
+
+# Splits the video stream at keyframes into ~segment_seconds chunks without re-encoding.
+# The chunk boundaries (filename,start,end) are written to segment_list as CSV.
+# When audio_path is given the audio track is copied out once so chunks can be encoded video-only.
+def build_split_command(input_path: str, chunk_pattern: str, segment_list: str, segment_seconds: int, audio_path: str = None):
+    cmd = [
+        "ffmpeg",
+        "-y",
+        *_input_args(input_path),
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_time", str(segment_seconds),
+        "-segment_format", "matroska",
+        "-segment_list", segment_list,
+        "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        chunk_pattern
+    ]
+    if audio_path:
+        cmd += ["-map", "0:a:0", "-vn", "-c", "copy", audio_path]
+    return cmd
+
+
+# Encodes one video-only chunk of a rendition (a stream-copied rung is only remuxed)
+def build_chunk_command(input_path: str, res_scale: str, output_path: str, threads: int = DEFAULT_ENCODE_THREADS):
+    if res_scale == STREAM_COPY:
+        video_args = ["-c:v", "copy"]
+    else:
+        video_args = [
+            "-vf", f"scale={res_scale}",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-threads", str(threads),
+            *_gop_args(),
+        ]
+    return [
+        "ffmpeg",
+        "-y",
+        *_input_args(input_path),
+        "-an",
+        *video_args,
+        "-progress", "pipe:1",
+        output_path
+    ]
+
+
+# Joins encoded chunks listed in concat_list (ffmpeg concat demuxer format) without re-encoding,
+# muxing the separately extracted audio track back in when there is one
+def build_concat_command(concat_list: str, output_path: str, audio_path: str = None):
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", concat_list,
+    ]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    return cmd + ["-c", "copy", *_output_args(output_path)]
+
+
+# Repackages an encoded MP4 rendition into HLS segments + a VOD playlist without re-encoding
+def build_hls_command(input_path: str, output_dir: str):
+    segment_ext = "m4s" if HLS_SEGMENT_TYPE == "fmp4" else "ts"
+    cmd = [
+        "ffmpeg",
+        "-y",
+        *_input_args(input_path),
+        "-map", "0:v:0",
+        "-map", "0:a:0?",
+        "-c", "copy",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_DURATION),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", HLS_SEGMENT_TYPE,
+        "-hls_segment_filename", os.path.join(output_dir, f"seg_%05d.{segment_ext}"),
+    ]
+    if HLS_SEGMENT_TYPE == "fmp4":
+        cmd += ["-hls_fmp4_init_filename", "init.mp4"]
+    return cmd + [os.path.join(output_dir, "playlist.m3u8")]
+
+
+# Returns the (width, height) of the first video stream, or None if it cannot be probed
+def get_video_resolution(file_path: str):
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height",
+        "-of", "csv=s=x:p=0",
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        width, height = result.stdout.strip().split("x")[:2]
+        return int(width), int(height)
+    except Exception:
+        return None
+
+
+# Groups ffmpeg's "-progress" output (key=value lines) into one dict per update block.
+# A block ends with its "progress=continue" / "progress=end" line. Other output mixed into the
+# stream (stderr is redirected there too) is skipped without being parsed further.
+def read_progress_blocks(lines):
+    block = {}
+    for line in lines:
+        key, sep, value = line.rstrip("\n").partition("=")
+        if not sep or not key.isidentifier():
+            continue
+        block[key] = value.strip()
+        if key == "progress":
+            yield block
+            block = {}
+
+
+# Runs an ffmpeg command that writes "-progress pipe:1" and hands every progress block to on_progress
+# (see worker.tasks.progress.ProgressReporter, which also does the throttling).
+# streams are StreamedOutput objects whose pipe targets appear in cmd; their write ends are passed to ffmpeg.
+def run_ffmpeg(cmd: list, on_progress=None, streams=()):
+    # Start the process without blocking using Popen
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            pass_fds=[fd for stream in streams for fd in stream.pass_fds]
+        )
+    finally:
+        # Only the child may keep the write ends open, otherwise the readers never see EOF
+        for stream in streams:
+            stream.release_write_end()
+
+    for block in read_progress_blocks(process.stdout):
+        if on_progress:
+            on_progress(block)
+
+    process.wait()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
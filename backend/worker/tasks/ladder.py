@@ -0,0 +1,167 @@
+import json
+import logging
+import subprocess
+import sys
+from app.core.config import ABR_PACKAGING, LADDER_STREAM_COPY, RENDITION_ORDER
+from app.services.scheduler import rung_pixels
+from worker.tasks.ffmpeg import RESOLUTIONS, STREAM_COPY
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+# Scale to the source size itself (rounded down to even dimensions, as libx264 requires)
+NATIVE_SCALE = "trunc(iw/2)*2:trunc(ih/2)*2"
+
+
+def _frame_rate(value: str):
+    try:
+        num, den = value.split("/")
+        return round(int(num) / int(den), 3) if int(den) else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rotation(stream: dict) -> int:
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(side_data["rotation"])
+    return _int(stream.get("tags", {}).get("rotate")) or 0
+
+
+# Runs one ffprobe over the source and keeps what the ladder and the cost estimates need:
+# duration, display size, frame rate, codecs, bitrates and the audio layout. Returns None if probing fails
+# or takes longer than timeout seconds.
+def probe_source(input_path: str, timeout: float = None):
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        input_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=timeout)
+        data = json.loads(result.stdout)
+    except subprocess.TimeoutExpired:
+        logger.error(f"Probing the source took longer than {timeout}s, giving up")
+        return None
+    except Exception as e:
+        logger.error(f"Failed to probe source: {e}")
+        return None
+
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video" and not s.get("disposition", {}).get("attached_pic")), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    fmt = data.get("format", {})
+
+    info = {
+        "duration": float(fmt.get("duration") or (video or {}).get("duration") or 0),
+        "format": fmt.get("format_name"),
+        "bit_rate": _int(fmt.get("bit_rate")),
+        "video": None,
+        "audio": None,
+    }
+    if video:
+        width, height = _int(video.get("width")), _int(video.get("height"))
+        rotation = _rotation(video)
+        # ffmpeg auto-rotates while filtering, so the ladder works on the displayed size
+        if abs(rotation) % 180 == 90:
+            width, height = height, width
+        info["video"] = {
+            "codec": video.get("codec_name"),
+            "profile": video.get("profile"),
+            "pix_fmt": video.get("pix_fmt"),
+            "width": width,
+            "height": height,
+            "rotation": rotation,
+            "fps": _frame_rate(video.get("avg_frame_rate")) or _frame_rate(video.get("r_frame_rate")),
+            "bit_rate": _int(video.get("bit_rate")),
+        }
+    if audio:
+        info["audio"] = {
+            "codec": audio.get("codec_name"),
+            "channels": _int(audio.get("channels")),
+            "channel_layout": audio.get("channel_layout"),
+            "sample_rate": _int(audio.get("sample_rate")),
+            "bit_rate": _int(audio.get("bit_rate")),
+        }
+    return info
+
+
+# A source that can go into the MP4 rendition unchanged
+def _can_stream_copy(video: dict) -> bool:
+    return (
+        LADDER_STREAM_COPY
+        # Copied streams keep the source's keyframes, which would break the GOP alignment HLS variants need
+        and ABR_PACKAGING != "hls"
+        and video["codec"] == "h264"
+        and video["pix_fmt"] == "yuv420p"
+        and video["rotation"] == 0
+        # libx264 output is always even-sized; an odd source is re-encoded to match the other rungs
+        and video["width"] % 2 == 0
+        and video["height"] % 2 == 0
+    )
+
+
+# Computes the ladder for a probed source as {res_name: res_scale} (see STREAM_COPY).
+#   - every rung is fitted into its box keeping the source's aspect ratio (portrait sources use the box turned 90 degrees)
+#   - rungs above the source are skipped rather than upscaled, so a rung's name always matches its output height;
+#     only a source below every rung keeps the smallest rung, encoded at the source size, so the job has an output
+#   - a rung at the source size is stream-copied when the codec allows it
+# Without probe data the full configured ladder is encoded.
+def build_ladder(source_info: dict) -> dict:
+    video = (source_info or {}).get("video")
+    if not video or not video.get("width") or not video.get("height"):
+        return {res_name: f"{res_scale}:force_original_aspect_ratio=decrease:force_divisible_by=2" for res_name,res_scale in RESOLUTIONS.items()}
+
+    source_short, source_long = sorted((video["width"], video["height"]))
+    portrait = video["height"] > video["width"]
+    native = STREAM_COPY if _can_stream_copy(video) else NATIVE_SCALE
+
+    # Factor the source is scaled by to fit each rung's box
+    boxes = {res_name: sorted(int(side) for side in res_scale.split(":")) for res_name,res_scale in RESOLUTIONS.items()}
+    factors = {res_name: min(box_short / source_short, box_long / source_long) for res_name,(box_short, box_long) in boxes.items()}
+    capped = min(factors, key=factors.get) if min(factors.values()) > 1 else None
+
+    ladder = {}
+    for res_name, (box_short, box_long) in boxes.items():
+        if factors[res_name] == 1 or res_name == capped:
+            ladder[res_name] = native
+        elif factors[res_name] < 1:
+            box = f"{box_short}:{box_long}" if portrait else f"{box_long}:{box_short}"
+            ladder[res_name] = f"{box}:force_original_aspect_ratio=decrease:force_divisible_by=2"
+
+    logger.info(f"Ladder for {video['width']}x{video['height']} {video['codec']} source: {ladder}")
+    return ladder
+
+
+# Encode and publish order of a ladder: with RENDITION_ORDER=cheapest_first, stream-copied rungs first and then
+# by output pixels, so the first playable rendition is ready as early as possible
+def order_ladder(ladder: dict, source_info: dict = None) -> dict:
+    if RENDITION_ORDER != "cheapest_first":
+        return ladder
+    video = (source_info or {}).get("video") or {}
+
+    def cost(res_name):
+        if ladder[res_name] == STREAM_COPY:
+            return 0
+        if video.get("width") and video.get("height"):
+            return rung_pixels(res_name, video["width"], video["height"])
+        box_width, box_height = (int(side) for side in RESOLUTIONS[res_name].split(":"))
+        return box_width * box_height
+
+    return {res_name: ladder[res_name] for res_name in sorted(ladder, key=cost)}
@@ -0,0 +1,50 @@
+import os
+import glob
+import logging
+import sys
+from celery.signals import worker_init, worker_process_shutdown, task_retry, task_failure
+from prometheus_client import start_http_server, multiprocess
+from app.core.config import WORKER_METRICS_PORT
+from app.core.metrics import TASK_RETRIES, TASK_FAILURES, metrics_registry
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+# Starts the exporter in the main worker process, before the pool forks its children
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    if not WORKER_METRICS_PORT:
+        return
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        # Samples left by the processes of an earlier run would be added to this run's
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+    else:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set: metrics recorded in pool child processes are not exported")
+    start_http_server(WORKER_METRICS_PORT, registry=metrics_registry())
+    logger.info(f"Metrics exporter listening on port {WORKER_METRICS_PORT}")
+
+
+@worker_process_shutdown.connect
+def mark_process_dead(pid=None, **kwargs):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR") and pid:
+        multiprocess.mark_process_dead(pid)
+
+
+@task_retry.connect
+def count_retry(sender=None, **kwargs):
+    TASK_RETRIES.labels(task=getattr(sender, "name", "unknown")).inc()
+
+
+@task_failure.connect
+def count_failure(sender=None, **kwargs):
+    TASK_FAILURES.labels(task=getattr(sender, "name", "unknown")).inc()
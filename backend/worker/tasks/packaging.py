@@ -0,0 +1,131 @@
+import os
+import logging
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from app.services.s3_client import s3_client, BUCKET_NAME
+from worker.tasks.ffmpeg import build_hls_command, get_video_resolution
+from worker.tasks.workspace import job_workspace
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+UPLOAD_WORKERS = 8
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".ts": "video/mp2t",
+}
+
+
+# S3 layout for ABR output: output/{job_id}/master.m3u8 and output/{job_id}/{res_name}/...
+def hls_prefix(job_id: str) -> str:
+    return f"output/{job_id}/"
+
+def master_playlist_key(job_id: str) -> str:
+    return f"{hls_prefix(job_id)}master.m3u8"
+
+
+# Reads (duration, filename) pairs from a VOD media playlist
+def _playlist_segments(playlist_path: str):
+    segments = []
+    duration = None
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((duration, line))
+                duration = None
+    return segments
+
+
+# Peak and average bitrate of a packaged variant, as required by EXT-X-STREAM-INF
+def _variant_bandwidth(variant_dir: str):
+    segments = _playlist_segments(os.path.join(variant_dir, "playlist.m3u8"))
+    peak = 0
+    total_bits = 0
+    total_duration = 0.0
+    for duration, filename in segments:
+        bits = os.path.getsize(os.path.join(variant_dir, filename)) * 8
+        total_bits += bits
+        total_duration += duration
+        if duration > 0:
+            peak = max(peak, int(bits / duration))
+    average = int(total_bits / total_duration) if total_duration else peak
+    return peak or average, average
+
+
+def _upload_file(local_path: str, key: str):
+    _, ext = os.path.splitext(local_path)
+    s3_client.upload_file(
+        local_path,
+        BUCKET_NAME,
+        key,
+        ExtraArgs={"ContentType": CONTENT_TYPES.get(ext, "application/octet-stream")}
+    )
+
+
+# Packages a finished MP4 rendition as HLS, uploads it under output/{job_id}/{res_name}/
+# and returns the variant entry used later for the master playlist.
+# The variant is written to a workspace of its own; its space is part of the encoding task's reservation.
+def package_hls(job_id: str, res_name: str, mp4_path: str) -> dict:
+    workspace = job_workspace(job_id, f"{res_name}_hls").create()
+    variant_dir = workspace.file("variant")
+    try:
+        os.makedirs(variant_dir, exist_ok=True)
+        cmd = build_hls_command(mp4_path, variant_dir)
+        logger.info(f"Packaging {res_name} as HLS: {' '.join(cmd)}")
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+        bandwidth, average_bandwidth = _variant_bandwidth(variant_dir)
+        resolution = get_video_resolution(mp4_path)
+
+        # Segments first, playlist last, so a playlist never points at missing segments
+        filenames = sorted(os.listdir(variant_dir), key=lambda name: name.endswith(".m3u8"))
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            list(pool.map(
+                lambda name: _upload_file(os.path.join(variant_dir, name), f"{hls_prefix(job_id)}{res_name}/{name}"),
+                filenames[:-1]
+            ))
+        _upload_file(os.path.join(variant_dir, filenames[-1]), f"{hls_prefix(job_id)}{res_name}/{filenames[-1]}")
+
+        logger.info(f"Uploaded HLS variant {res_name} for job {job_id} ({len(filenames)} files)")
+        return {
+            "playlist": f"{res_name}/playlist.m3u8",
+            "bandwidth": bandwidth,
+            "average_bandwidth": average_bandwidth,
+            "resolution": f"{resolution[0]}x{resolution[1]}" if resolution else None,
+        }
+    finally:
+        workspace.teardown()
+
+
+# Writes output/{job_id}/master.m3u8 referencing every packaged variant (lowest bitrate first)
+def write_master_playlist(job_id: str, variants: list) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for variant in sorted(variants, key=lambda v: v["bandwidth"]):
+        attributes = f"BANDWIDTH={variant['bandwidth']},AVERAGE-BANDWIDTH={variant['average_bandwidth']}"
+        if variant.get("resolution"):
+            attributes += f",RESOLUTION={variant['resolution']}"
+        lines.append(f"#EXT-X-STREAM-INF:{attributes}")
+        lines.append(variant["playlist"])
+
+    key = master_playlist_key(job_id)
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=("\n".join(lines) + "\n").encode(),
+        ContentType=CONTENT_TYPES[".m3u8"]
+    )
+    logger.info(f"Wrote master playlist for job {job_id} with {len(variants)} variants")
+    return key
@@ -0,0 +1,74 @@
+import time
+from app.core.progress_store import progress_store
+
+
+def _float(value: str, suffix: str = ""):
+    try:
+        return float(value[:-len(suffix)] if suffix and value.endswith(suffix) else value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProgressReporter:
+    """Turns ffmpeg progress blocks into rendition progress entries.
+
+    One reporter covers one ffmpeg process and the renditions it writes
+    (several for a single-pass encode). Besides the percentage it keeps the
+    frame, fps, speed and bitrate ffmpeg reports. Entries are written to the
+    progress store only when the percentage moved by min_step or min_interval
+    seconds passed, and then only the fields that changed are published, so a
+    busy worker does a handful of Redis writes per rendition instead of one
+    per progress line.
+    """
+
+    def __init__(self, job_id: str, entries: dict, total_duration: float, min_interval: float = 2.0, min_step: int = 5):
+        self.job_id = job_id
+        # {res_name: entry}: the caller's own dicts, updated in place
+        self.entries = entries
+        self.total_duration = total_duration or 0
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self._published = {res_name: dict(entry) for res_name, entry in entries.items()}
+        self._last_flush = time.monotonic()
+        self._last_percent = None
+
+    # Called by run_ffmpeg with one parsed progress block
+    def __call__(self, block: dict):
+        stats = {}
+        # out_time_ms is in microseconds as well (an old ffmpeg naming mistake)
+        out_time = _float(block.get("out_time_us") or block.get("out_time_ms"))
+        if out_time is not None and self.total_duration > 0:
+            stats["progress"] = max(0, min(int(out_time / 1_000_000 / self.total_duration * 100), 100))
+        frame = _float(block.get("frame"))
+        if frame is not None:
+            stats["frame"] = int(frame)
+        for name, suffix in (("fps", ""), ("speed", "x"), ("bitrate", "kbits/s")):
+            value = _float(block.get(name), suffix)
+            if value is not None:
+                stats[name] = value
+
+        for entry in self.entries.values():
+            entry.update(stats)
+
+        percent = stats.get("progress")
+        now = time.monotonic()
+        if (
+            block.get("progress") == "end"
+            or now - self._last_flush >= self.min_interval
+            or (percent is not None and (self._last_percent is None or percent - self._last_percent >= self.min_step))
+        ):
+            self.flush()
+
+    # Writes the entries and publishes what changed since the previous flush
+    def flush(self):
+        deltas = {}
+        for res_name, entry in self.entries.items():
+            published = self._published.setdefault(res_name, {})
+            delta = {name: value for name, value in entry.items() if published.get(name) != value}
+            if delta:
+                deltas[res_name] = delta
+                published.update(delta)
+        self._last_flush = time.monotonic()
+        self._last_percent = next((entry.get("progress") for entry in self.entries.values()), None)
+        if deltas:
+            progress_store.set_renditions(self.job_id, {res_name: self.entries[res_name] for res_name in deltas}, deltas)
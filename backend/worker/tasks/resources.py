@@ -0,0 +1,166 @@
+import os
+import math
+import time
+import fcntl
+import logging
+import sys
+from contextlib import contextmanager
+from app.core.config import (
+    WORKSPACE_ROOT, ENCODE_MEGAPIXELS_PER_THREAD, ENCODE_MEMORY_BASE, ENCODE_MEMORY_PER_MEGAPIXEL, ENCODE_MEMORY_FRACTION,
+    NODE_CLASS as NODE_CLASS_NAME
+)
+from app.core.metrics import ENCODE_SLOT_WAIT_SECONDS
+from app.services.scheduler import rung_pixels
+from worker.tasks.ffmpeg import RESOLUTIONS, STREAM_COPY
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+# Encode slots are lock files on the scratch volume, so every worker process (and pool) on the node shares them.
+# A lock held by a process that dies is released by the kernel.
+SLOT_DIR = os.path.join(WORKSPACE_ROOT, ".slots")
+SLOT_POLL_INTERVAL = 0.5
+
+# Frame rate assumed when the source was not probed
+DEFAULT_FPS = 30
+
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# CPUs this worker may use: the CPUs it is allowed to run on, capped by the cgroup CPU quota
+# (cgroup v2 cpu.max or v1 cpu.cfs_quota_us), which os.cpu_count() does not see inside containers
+def detect_cpus() -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = None
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        limit, period = cpu_max.split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    else:
+        limit, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+    if quota:
+        cpus = min(cpus, math.floor(quota))
+    return max(cpus, 1)
+
+
+# Memory this worker may use in bytes: the machine's RAM, capped by the cgroup limit
+# (cgroup v2 memory.max or v1 memory.limit_in_bytes; "max" and v1's huge "unlimited" value are ignored)
+def detect_memory() -> int:
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = _read(path)
+        if limit and limit.isdigit():
+            return min(total, int(limit))
+    return total
+
+
+CPUS = detect_cpus()
+ENCODE_MEMORY = int(detect_memory() * ENCODE_MEMORY_FRACTION)
+# Memory that comes with one slot; an encode predicted to need more takes extra slots
+MEMORY_PER_SLOT = ENCODE_MEMORY / CPUS
+# Class of this node in the encode statistics (nodes of one class are expected to encode at the same speed)
+NODE_CLASS = NODE_CLASS_NAME or f"{CPUS}cpu"
+
+
+# Predicted memory of one libx264 encode by output frame size
+def encode_memory(pixels: float) -> int:
+    return int(ENCODE_MEMORY_BASE + pixels / 1e6 * ENCODE_MEMORY_PER_MEGAPIXEL)
+
+
+# Output pixels per frame and frame rate of one rung; without probe data the rung's box at DEFAULT_FPS
+def rung_frame(res_name: str, source_info: dict = None):
+    video = (source_info or {}).get("video") or {}
+    if video.get("width") and video.get("height"):
+        pixels = rung_pixels(res_name, video["width"], video["height"])
+    else:
+        box_width, box_height = (int(side) for side in RESOLUTIONS[res_name].split(":"))
+        pixels = box_width * box_height
+    return pixels, video.get("fps") or DEFAULT_FPS
+
+
+# Encoder threads and slots of one rung, from its output pixel rate (frame pixels x fps):
+# one thread per ENCODE_MEGAPIXELS_PER_THREAD, and one slot per thread or per MEMORY_PER_SLOT of predicted
+# memory, whichever is more. Stream-copied rungs take no slot. The plan also carries the pixels and frame
+# rate, which the encode statistics are recorded with.
+def plan_rung(res_name: str, res_scale: str, source_info: dict = None) -> dict:
+    if res_scale == STREAM_COPY:
+        return {"threads": 1, "slots": 0, "pixels": 0, "fps": 0}
+
+    pixels, fps = rung_frame(res_name, source_info)
+    threads = min(CPUS, max(1, round(pixels * fps / (ENCODE_MEGAPIXELS_PER_THREAD * 1e6))))
+    slots = min(CPUS, max(threads, math.ceil(encode_memory(pixels) / MEMORY_PER_SLOT)))
+    return {"threads": threads, "slots": slots, "pixels": pixels, "fps": fps}
+
+
+# Plans of every rung of a ladder, as {res_name: {"threads", "slots", "pixels", "fps"}} (JSON-safe, so subtasks can carry them)
+def plan_encodes(ladder: dict, source_info: dict = None) -> dict:
+    return {res_name: plan_rung(res_name, res_scale, source_info) for res_name,res_scale in ladder.items()}
+
+
+# Worker processes when WORKER_CONCURRENCY is not set: one per CPU, fewer when the memory would not hold that
+# many encodes of the smallest configured rung. Processes beyond the free slots wait in encode_slots.
+def default_concurrency() -> int:
+    smallest = min(int(width) * int(height) for width, height in (scale.split(":") for scale in RESOLUTIONS.values()))
+    return max(1, min(CPUS, ENCODE_MEMORY // encode_memory(smallest)))
+
+
+@contextmanager
+def _flock(path: str):
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# Holds slots encode slots of the node-wide pool (one per CPU) while the block runs.
+# One encode at a time collects its slots and keeps the ones it got, so a 1080p encode waiting for
+# several cores is not starved by small encodes taking every slot that frees up.
+@contextmanager
+def encode_slots(slots: int, rung: str = ""):
+    slots = min(slots, CPUS)
+    held = {}
+    try:
+        if slots > 0:
+            os.makedirs(SLOT_DIR, exist_ok=True)
+            started = time.perf_counter()
+            with _flock(os.path.join(SLOT_DIR, "queue.lock")):
+                while True:
+                    for index in range(CPUS):
+                        if len(held) == slots:
+                            break
+                        if index in held:
+                            continue
+                        slot = open(os.path.join(SLOT_DIR, f"{index}.lock"), "a")
+                        try:
+                            fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            held[index] = slot
+                        except BlockingIOError:
+                            slot.close()
+                    if len(held) == slots:
+                        break
+                    time.sleep(SLOT_POLL_INTERVAL)
+            waited = time.perf_counter() - started
+            ENCODE_SLOT_WAIT_SECONDS.labels(rung=rung).observe(waited)
+            if waited > 1:
+                logger.info(f"Waited {waited:.1f}s for {slots} encode slots ({rung or 'all'})")
+        yield
+    finally:
+        for slot in held.values():
+            slot.close()
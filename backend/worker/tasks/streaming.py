@@ -0,0 +1,65 @@
+import os
+import logging
+import threading
+from app.core.config import STREAM_PART_SIZE, STREAM_MAX_INFLIGHT_PARTS
+from app.services.s3_stream import MultipartUploadStream
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+
+
+class StreamedOutput:
+    """An ffmpeg output that goes straight to S3 instead of a temp file.
+
+    ffmpeg writes fragmented MP4 into an OS pipe (target "pipe:N").
+    A background thread reads the pipe and feeds a MultipartUploadStream,
+    so encoding and uploading overlap and nothing touches the scratch disk.
+    Pass the object to run_ffmpeg(streams=...) so the pipe's write end is
+    handed to the ffmpeg process.
+    """
+
+    def __init__(self, object_name: str):
+        self.object_name = object_name
+        self.upload = MultipartUploadStream(object_name, part_size=STREAM_PART_SIZE, max_in_flight=STREAM_MAX_INFLIGHT_PARTS)
+        self._read_fd, self._write_fd = os.pipe()
+        self.target = f"pipe:{self._write_fd}"
+        self.pass_fds = (self._write_fd,)
+        self.error = None
+        self.bytes_written = 0
+        self._thread = threading.Thread(target=self._pump, name=f"stream-{object_name}", daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        # Closing the read end on an error makes ffmpeg fail with EPIPE instead of blocking forever
+        try:
+            with os.fdopen(self._read_fd, "rb") as pipe:
+                while True:
+                    data = pipe.read(READ_SIZE)
+                    if not data:
+                        break
+                    self.upload.write(data)
+                    self.bytes_written += len(data)
+        except Exception as e:
+            logger.error(f"Streaming upload of {self.object_name} failed: {e}")
+            self.error = e
+
+    # Called once ffmpeg has been spawned: the child holds its own copy of the write end
+    def release_write_end(self):
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+    # Waits for ffmpeg's output to be drained and completes the multipart upload
+    def complete(self):
+        self.release_write_end()
+        self._thread.join()
+        if self.error:
+            raise self.error
+        self.upload.close()
+        logger.info(f"Streamed {self.object_name} to S3 ({self.bytes_written} bytes)")
+
+    def abort(self):
+        self.release_write_end()
+        self._thread.join()
+        self.upload.abort()
@@ -1,15 +1,30 @@
 import os
 import subprocess
-import re
+import time
 import logging
 import sys
-import time
+from celery.exceptions import Ignore, Retry
 from app.core.celery_app import celery_app
-from worker.tasks.ffmpeg import RESOLUTIONS
+from worker.tasks.ffmpeg import RESOLUTIONS, build_rendition_command, build_single_pass_command, run_ffmpeg
+from worker.tasks.progress import ProgressReporter
+from app.core.config import TRANSCODE_MODE, ABR_PACKAGING, STREAM_OUTPUT, INPUT_MODE, INPUT_CACHE_MULTIPASS, INPUT_URL_EXPIRATION, TASK_MAX_DELIVERIES, PROGRESSIVE_FIRST_RENDITION
+from app.services.s3_service import generate_presigned_get_url
+from worker.tasks.ladder import probe_source, build_ladder, order_ladder
+from worker.tasks.packaging import package_hls, write_master_playlist
+from worker.tasks.streaming import StreamedOutput
+from worker.tasks.resources import NODE_CLASS, plan_encodes, encode_slots
+from worker.tasks.workspace import Workspace, InsufficientDiskSpace, job_workspace, reserve_or_defer, failure_retries_left, retry_failure, predict_rendition_bytes, estimate_bytes
 from app.services.s3_client import s3_client, BUCKET_NAME
 from contextlib import closing
 from app.db.database import sessionLocal
 from app.core.job_store import job_store
+from app.core.job_cache import job_cache
+from app.core.progress_store import progress_store
+from app.core.rendition_store import rendition_store
+from app.core.delivery_store import delivery_store
+from app.core.encode_stat_store import encode_stat_store
+from app.core.metrics import RENDITION_FAILURES, FIRST_RENDITION_SECONDS, track_stage, observe_encode, observe_upload
+from datetime import datetime
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +35,6 @@ handler.setFormatter(formatter)
 if not logger.handlers:
     logger.addHandler(handler)
 
-TEMP_DIR = "/tmp"
 # This function helps to get the duration of the video to help in getting the progress
 def get_video_duration(file_path: str):
     
@@ -39,6 +53,354 @@ def get_video_duration(file_path: str):
         return 0.0
 
 
+# Returns True if the file has at least one audio stream
+def has_audio_stream(file_path: str):
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return bool(result.stdout.strip())
+    except Exception as e:
+        logger.error(f"Failed to probe audio streams: {e}")
+        return False
+
+
+# Whether the source is copied to local disk. passes is how many times the encode reads the whole input.
+def downloads_source(passes: int = 1) -> bool:
+    return INPUT_MODE != "stream" or (passes > 1 and INPUT_CACHE_MULTIPASS)
+
+
+# Decides where ffprobe/ffmpeg read the source from: a presigned URL, or a local copy in the task's workspace.
+# size is the source size in bytes when the caller already knows it.
+def fetch_source(workspace: Workspace, object_name: str, passes: int = 1, size: int = None):
+    if not downloads_source(passes):
+        url = generate_presigned_get_url(object_name, expiration=INPUT_URL_EXPIRATION)
+        if not url:
+            raise Exception(f"Could not create a presigned URL for {object_name}")
+        logger.info(f"Streaming input {object_name} from S3")
+        return url
+
+    _, ext = os.path.splitext(object_name)
+    local_path = workspace.file(f"input{ext}")
+    # A retried or redelivered task on the same node finds the complete download of its earlier attempt
+    # (download_file only renames the file into place once it is complete)
+    if os.path.exists(local_path) and os.path.getsize(local_path) == (size or source_size(object_name)):
+        logger.info(f"Reusing the downloaded input {object_name}")
+        return local_path
+    s3_client.download_file(
+        BUCKET_NAME,
+        object_name,
+        local_path
+    )
+    return local_path
+
+
+def source_size(object_name: str) -> int:
+    return s3_client.head_object(Bucket=BUCKET_NAME, Key=object_name)["ContentLength"]
+
+
+# Predicted scratch usage of transcode_video itself: the local source copy plus the renditions it writes
+# (all at once in a single pass, one after another per rendition). Fan-out subtasks reserve their own
+# workspaces; the chunked mode only needs room for the split chunks, about the size of the source.
+def predict_job_bytes(size: int, source_info: dict, passes: int) -> int:
+    local_input = downloads_source(passes)
+    if TRANSCODE_MODE == "fanout":
+        return estimate_bytes(size, local_input)
+    if TRANSCODE_MODE == "chunked":
+        return estimate_bytes(size, local_input, [size])
+    renditions = list(predict_rendition_bytes(size, build_ladder(source_info), source_info).values())
+    packaged = ABR_PACKAGING == "hls"
+    if STREAM_OUTPUT:
+        # Only the HLS variant of one rendition at a time is written locally
+        return estimate_bytes(size, local_input, [max(renditions)] if packaged else [])
+    return estimate_bytes(size, local_input, renditions, concurrent=TRANSCODE_MODE == "single_pass", packaged=packaged)
+
+
+# Predicted scratch usage of every fan-out subtask: its own copy of the source and its rendition
+def predict_fanout_bytes(size: int, ladder: dict, source_info: dict) -> dict:
+    packaged = ABR_PACKAGING == "hls"
+    predictions = {}
+    for res_name, predicted in predict_rendition_bytes(size, ladder, source_info).items():
+        if STREAM_OUTPUT:
+            # Only the HLS variant is written locally
+            predictions[res_name] = estimate_bytes(size, downloads_source(), [predicted] if packaged else [])
+        else:
+            predictions[res_name] = estimate_bytes(size, downloads_source(), [predicted], packaged=packaged)
+    return predictions
+
+
+# Uploads a finished rendition to S3 under output/
+def upload_output(output_path: str, output_filename: str):
+    s3_client.upload_file(
+        output_path,
+        BUCKET_NAME,
+        f"output/{output_filename}"
+    )
+    logger.info(f"Uploaded {output_filename} to S3")
+
+
+# Where ffmpeg writes a rendition: a file in the workspace, or with STREAM_OUTPUT a pipe into an S3 multipart upload.
+# Returns (output target, StreamedOutput or None).
+def open_output(workspace: Workspace, job_id: str, res_name: str):
+    if STREAM_OUTPUT:
+        stream = StreamedOutput(f"output/{job_id}_{res_name}.mp4")
+        return stream.target, stream
+    return workspace.file(f"output_{res_name}.mp4"), None
+
+
+# Renditions table bookkeeping. Each call uses its own short session, so the subtasks
+# (which have no session of their own) can use it too. The cached job record is dropped on every change.
+def record_renditions_started(job_id: str, res_names: list):
+    with closing(sessionLocal()) as db:
+        rendition_store.mark_started(db, job_id, res_names)
+    job_cache.invalidate(job_id)
+
+
+def record_rendition_failed(job_id: str, res_name: str, error: str):
+    RENDITION_FAILURES.labels(rung=res_name).inc()
+    try:
+        with closing(sessionLocal()) as db:
+            rendition_store.mark_failed(db, job_id, res_name, error)
+        job_cache.invalidate(job_id)
+    except Exception as e:
+        logger.error(f"Could not record failed rendition {res_name} of job {job_id}: {e}")
+
+
+# Stores size, ETag, duration and bitrate of an uploaded rendition; from now on status and download serve it
+def record_rendition_completed(job_id: str, res_name: str, object_name: str, duration: float):
+    head = s3_client.head_object(Bucket=BUCKET_NAME, Key=object_name)
+    with closing(sessionLocal()) as db:
+        rendition_store.mark_completed(db, job_id, res_name, object_name, head["ContentLength"], head["ETag"].strip('"'), duration)
+        # The first playable rendition is what users wait for
+        completed = [rendition for rendition in rendition_store.get_renditions(db, job_id) if rendition.status == "COMPLETED"]
+        job = job_store.get_job(db, job_id) if len(completed) == 1 else None
+        if job and job.created_at:
+            FIRST_RENDITION_SECONDS.observe((datetime.utcnow() - job.created_at).total_seconds())
+    job_cache.invalidate(job_id)
+
+
+# Stores a finished encode in encode_stats, which the ETA and cost estimator learn from. plans are the plans of the
+# rungs the ffmpeg run wrote (several for a single pass); stream copies and encodes of unknown length are skipped.
+# A failed write is only logged, it never fails the encode.
+def record_encode(job_id: str, rung: str, mode: str, plans: list, source_duration: float, seconds: float):
+    pixels = sum(plan.get("pixels", 0) for plan in plans)
+    if not pixels or seconds <= 0 or not source_duration or source_duration <= 1:
+        return
+    try:
+        with closing(sessionLocal()) as db:
+            encode_stat_store.record(
+                db,
+                job_id=job_id,
+                rung=rung,
+                mode=mode,
+                node_class=NODE_CLASS,
+                threads=sum(plan["threads"] for plan in plans),
+                source_duration=source_duration,
+                pixels=pixels,
+                fps=max(plan.get("fps", 0) for plan in plans),
+                wall_seconds=seconds,
+                speed=source_duration / seconds
+            )
+    except Exception as e:
+        logger.warning(f"Could not record encode stats of {rung} for job {job_id}: {e}")
+
+
+# Uploads a finished rendition and, when ABR packaging is enabled, its HLS variant.
+# The variant is kept on the rendition's progress entry so the master playlist can be written at the end.
+# duration is the encoded length in seconds; when unknown it is probed from the local output.
+def publish_rendition(job_id: str, res_name: str, output_path: str, entry: dict, stream: StreamedOutput = None, duration: float = None):
+    object_name = f"output/{job_id}_{res_name}.mp4"
+    if stream:
+        # Already uploaded while encoding; packaging reads the object back through a presigned URL
+        stream.complete()
+        output_path = generate_presigned_get_url(stream.object_name)
+    else:
+        if duration is None:
+            duration = get_video_duration(output_path)
+        started = time.perf_counter()
+        upload_output(output_path, f"{job_id}_{res_name}.mp4")
+        observe_upload(res_name, time.perf_counter() - started, os.path.getsize(output_path))
+    record_rendition_completed(job_id, res_name, object_name, duration)
+    if ABR_PACKAGING == "hls":
+        try:
+            entry["hls"] = package_hls(job_id, res_name, output_path)
+        except Exception as e:
+            # The MP4 is already available, so a packaging failure does not fail the rendition
+            logger.error(f"HLS packaging failed for {res_name} of job {job_id}: {e}")
+
+
+# Renditions an earlier attempt of the job already finished, as progress entries: COMPLETED in the renditions
+# table and, with HLS packaging, packaged too (the variant entry is kept in the progress store).
+# A retried or redelivered task only encodes the others.
+def completed_renditions(db, job_id: str, ladder: dict) -> dict:
+    progress = progress_store.get_all(job_id)
+    completed = {}
+    for rendition in rendition_store.get_renditions(db, job_id):
+        entry = progress.get(rendition.name) or {}
+        if rendition.name in ladder and rendition.status == "COMPLETED" and (ABR_PACKAGING != "hls" or entry.get("hls")):
+            completed[rendition.name] = {**entry, "progress":100, "status":"COMPLETED", "error":None}
+    return completed
+
+
+# Transcode tasks are acknowledged late, so the broker delivers a task again when its worker dies (OOM kill,
+# lost node). Fails an attempt that was delivered more than TASK_MAX_DELIVERIES times instead of looping.
+def check_redelivery(task):
+    deliveries = delivery_store.record(task.request.id, task.request.retries)
+    if deliveries > TASK_MAX_DELIVERIES:
+        raise Exception(f"Task delivered {deliveries} times without finishing, giving up")
+    if deliveries > 1:
+        logger.warning(f"Task {task.name} {task.request.id} was redelivered ({deliveries} deliveries), resuming")
+
+
+def remove_temp_file(path: str):
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Cleaned up temp file: {os.path.basename(path)}")
+    except OSError as cleanup_error:
+        logger.warning(f"Could not clean up temp file {os.path.basename(path)}: {cleanup_error}")
+
+
+# Writes rendition entries to the progress store, which the status endpoint reads and the event stream pushes
+def report_progress(job_id: str, progress_tracker: dict, res_names: list = None):
+    progress_store.set_renditions(job_id, {res_name: progress_tracker[res_name] for res_name in res_names or progress_tracker})
+
+
+# Runs ffmpeg once per rendition, decoding the input again for every rung.
+# plans holds the encoder threads and node slots of every rung (see worker.tasks.resources).
+def encode_per_rendition(job_id: str, workspace: Workspace, input_path: str, total_duration: float, progress_tracker: dict, ladder: dict, plans: dict):
+    for res_name,res_scale in ladder.items():
+
+        output_path, stream = open_output(workspace, job_id, res_name)
+        cmd = build_rendition_command(input_path, res_scale, output_path, plans[res_name]["threads"])
+
+        logger.info(f"Running FFmpeg command for {res_name}: {' '.join(cmd)}")
+        try:
+            record_renditions_started(job_id, [res_name])
+
+            reporter = ProgressReporter(job_id, {res_name: progress_tracker[res_name]}, total_duration)
+            with encode_slots(plans[res_name]["slots"], res_name):
+                started = time.perf_counter()
+                run_ffmpeg(cmd, reporter, streams=[stream] if stream else ())
+                seconds = time.perf_counter() - started
+                observe_encode(res_name, seconds, total_duration)
+            record_encode(job_id, res_name, "per_rendition", [plans[res_name]], total_duration, seconds)
+
+            progress_tracker[res_name]["status"] = "COMPLETED"
+            progress_tracker[res_name]["progress"] = 100
+
+            # Uploading finished file to S3
+            publish_rendition(job_id, res_name, output_path, progress_tracker[res_name], stream, total_duration)
+
+        except Exception as e:
+            logger.error(f"Failed processing {res_name}:{e}")
+            progress_tracker[res_name]["status"] = "FAILED"
+            progress_tracker[res_name]["error"] = str(e)
+            if stream:
+                stream.abort()
+
+        finally:
+            # Always clean up output temp file, even on failure
+            if not stream:
+                remove_temp_file(output_path)
+            report_progress(job_id, progress_tracker, [res_name])
+
+
+# Decodes the input once and encodes every rendition in a single ffmpeg run (split/scale filter graph).
+# Raises if ffmpeg itself fails so the caller can fall back to encode_per_rendition.
+# The run holds the slots of every rung at once.
+def encode_single_pass(job_id: str, workspace: Workspace, input_path: str, total_duration: float, progress_tracker: dict, ladder: dict, plans: dict):
+    outputs = {}
+    streams = {}
+    try:
+        for res_name,res_scale in ladder.items():
+            output_path, stream = open_output(workspace, job_id, res_name)
+            outputs[res_name] = (res_scale, output_path)
+            if stream:
+                streams[res_name] = stream
+        cmd = build_single_pass_command(input_path, outputs, {res_name: plans[res_name]["threads"] for res_name in outputs})
+
+        logger.info(f"Running single-pass FFmpeg command: {' '.join(cmd)}")
+        record_renditions_started(job_id, list(outputs))
+
+        # Every output advances with the same decoded timestamp, so they share one reporter
+        reporter = ProgressReporter(job_id, {res_name: progress_tracker[res_name] for res_name in outputs}, total_duration)
+        with encode_slots(sum(plans[res_name]["slots"] for res_name in outputs)):
+            started = time.perf_counter()
+            run_ffmpeg(cmd, reporter, streams=list(streams.values()))
+            seconds = time.perf_counter() - started
+            observe_encode("all", seconds, total_duration)
+        record_encode(job_id, "all", "single_pass", [plans[res_name] for res_name in outputs], total_duration, seconds)
+
+        for res_name,(_, output_path) in outputs.items():
+            stream = streams.pop(res_name, None)
+            try:
+                progress_tracker[res_name]["status"] = "COMPLETED"
+                progress_tracker[res_name]["progress"] = 100
+                publish_rendition(job_id, res_name, output_path, progress_tracker[res_name], stream, total_duration)
+            except Exception as e:
+                logger.error(f"Failed uploading {res_name}:{e}")
+                progress_tracker[res_name]["status"] = "FAILED"
+                progress_tracker[res_name]["error"] = str(e)
+                if stream:
+                    stream.abort()
+
+    finally:
+        # Streams still here were never completed (ffmpeg failed), so drop their partial uploads
+        for stream in streams.values():
+            stream.abort()
+        for res_name,(_, output_path) in outputs.items():
+            if not STREAM_OUTPUT:
+                remove_temp_file(output_path)
+        report_progress(job_id, progress_tracker)
+
+
+# Computes the final job status from the per-rendition results and stores it in the database.
+# Shared by transcode_video and the fan-out chord callback. master_playlist is passed when the
+# playlist already exists (outputs copied from a duplicate job) instead of being written from the variants.
+def finish_job(task, db, job_id: str, progress_tracker: dict, master_playlist: str = None):
+    failed_tasks = [res for res,data in progress_tracker.items() if data["status"] == "FAILED"]
+    for res in failed_tasks:
+        record_rendition_failed(job_id, res, progress_tracker[res]["error"])
+
+    if len(failed_tasks) == len(progress_tracker):
+        logger.error(f"Job {job_id} completely failed.")
+        task.update_state(state="FAILURE",meta={"error":"All resolutions failed to process."})
+
+        job_store.update_job_status(db,job_id,status="FAILED",is_completed=True)
+        progress_store.publish_state(job_id, "FAILED")
+        raise Exception("All resolutions failed")
+
+    final_status = "PARTIAL_SUCCESS" if failed_tasks else "COMPLETED"
+    logger.info(f"Job {job_id} finished with status: {final_status}")
+
+    # Master playlist over every rendition that was packaged for ABR playback
+    variants = [data["hls"] for data in progress_tracker.values() if data.get("hls")]
+    if variants:
+        try:
+            master_playlist = write_master_playlist(job_id, variants)
+        except Exception as e:
+            logger.error(f"Failed writing master playlist for job {job_id}: {e}")
+
+    # Database updation
+    db_status = "SUCCESS" if final_status == "COMPLETED" else "FAILED"
+    job_store.update_job_status(db,job_id,status=db_status,is_completed=True)
+    progress_store.publish_state(job_id, final_status)
+
+    return {
+        "status":final_status,
+        "job_id": job_id,
+        "tasks":progress_tracker,
+        "master_playlist":master_playlist
+    }
+
+
 #This is the function which is involved in the conversion of the video
 @celery_app.task(
     bind=True,
@@ -46,163 +408,135 @@ def get_video_duration(file_path: str):
     default_retry_delay=60,      # Wait 60s before first retry
     retry_backoff_max=600,       # Max 10 minutes between retries
     task_time_limit=30 * 60,     # 30 minute timeout per task
-    soft_time_limit=25 * 60      # Timeout for cleanup
+    soft_time_limit=25 * 60,     # Timeout for cleanup
+    acks_late=True,              # Redelivered if the worker dies; the retry resumes from the finished renditions
+    reject_on_worker_lost=True
     )
 def transcode_video(self, job_id: str, object_name: str):
-    local_input_path = None
+    workspace = job_workspace(job_id)
+    retrying = False
 
     with closing(sessionLocal()) as db:
         try:
             logger.info(f"Received Job {job_id}: Processing {object_name}")
+            check_redelivery(self)
 
             job_store.update_job_status(db, job_id, status="PROCESSING")
 
-            _, ext = os.path.splitext(object_name)
-            local_input_path = os.path.join(TEMP_DIR, f"{job_id}_input{ext}")
+            # An identical earlier upload with the same ladder: copy its outputs instead of encoding again
+            from worker.tasks.dedup import reuse_duplicate_outputs
+            progress_tracker, master_playlist = reuse_duplicate_outputs(db, job_id, object_name)
+            if progress_tracker:
+                report_progress(job_id, progress_tracker)
+                return finish_job(self, db, job_id, progress_tracker, master_playlist)
+
+            # The API usually probed the source already when it estimated the job's cost
+            job = job_store.get_job(db, job_id)
+            source_info = job.source_info if job else None
+
+            # Only the per-rendition loop decodes the whole source more than once (the ladder is not known
+            # before probing, so the full configured ladder is assumed)
+            passes = len(RESOLUTIONS) if TRANSCODE_MODE == "per_rendition" else 1
             try:
-                s3_client.download_file(
-                    BUCKET_NAME,
-                    object_name,
-                    local_input_path
-                )
+                size = source_size(object_name)
+                # Waits (re-queued) until the predicted scratch usage fits on this node's volume
+                reserve_or_defer(self, workspace, predict_job_bytes(size, source_info, passes))
+                with track_stage("download"):
+                    input_path = fetch_source(workspace, object_name, passes, size)
+            except (Retry, InsufficientDiskSpace):
+                # Deferred for disk space, or deferred too often: the job fails below
+                raise
             except Exception as e:
                 error_msg = f"Failed to download object {object_name} from S3: {str(e)}"
                 logger.error(error_msg)
-                raise self.retry(exc=e, countdown=60)
+                if failure_retries_left(self):
+                    raise retry_failure(self, e, countdown=60)
+                raise
 
-            total_duration = get_video_duration(local_input_path)
+            # One probe for everything: duration for the progress, size/codec for the ladder
+            if not source_info:
+                with track_stage("probe"):
+                    source_info = probe_source(input_path)
+            total_duration = (source_info or {}).get("duration") or 0
             if total_duration == 0:
                 logger.warning("Could not determine the video duration.")
                 total_duration = 1 
 
-            progress_tracker = {res:{"progress":0,"status":"QUEUED","error":None} 
-                                for res in RESOLUTIONS.keys()
+            ladder = build_ladder(source_info)
+            job_store.set_source_info(db, job_id, source_info, ladder)
+            # Cheapest rendition first, so something is playable as early as possible
+            ladder = order_ladder(ladder, source_info)
+            plans = plan_encodes(ladder, source_info)
+
+            # Renditions uploaded by an earlier attempt are kept; only the missing ones are encoded
+            completed = completed_renditions(db, job_id, ladder)
+            remaining = {res:scale for res,scale in ladder.items() if res not in completed}
+            if completed:
+                logger.info(f"Job {job_id} resumes with {', '.join(completed)} already done")
+
+            progress_tracker = {res:completed.get(res) or {"progress":0,"status":"QUEUED","error":None} 
+                                for res in ladder.keys()
                                 }
             self.update_state(state="PROGRESS",meta={"tasks":progress_tracker})
-            
-            for res_name,res_scale in RESOLUTIONS.items():
-
-                output_filename = f"{job_id}_{res_name}.mp4"
-                output_path = os.path.join(TEMP_DIR, output_filename)
-
-                
-                cmd = [
-                    "ffmpeg",
-                    "-y",
-                    "-i", local_input_path,
-                    "-vf", f"scale={res_scale}",
-                    "-c:v", "libx264",
-                    "-c:a", "copy",
-                    "-preset", "veryfast",
-                    "-threads", "2",              # Limit threads to prevent OOM
-                    "-max_muxing_queue_size", "1024",  # Prevent buffering overflow
-                    "-progress", "pipe:1",
-                    output_path
-                ]
-
-                logger.info(f"Running FFmpeg command for {res_name}: {' '.join(cmd)}")
-                try:
-                # Start the process without blocking using Popen
-                    process = subprocess.Popen(
-                        cmd,
-                        stdout=subprocess.PIPE, 
-                        stderr=subprocess.STDOUT, 
-                        universal_newlines=True   
-                    )
-                    last_update_time = time.time()
-                    last_percent = -1
-                    min_update_interval = 2.0
-
-                    # Progress calculation
-                    for line in process.stdout:
-                        match = re.search(r"out_time_ms=(\d+)", line)
-                        
-                        if match:
-                            current_ms = int(match.group(1))
-                            current_seconds = current_ms / 1000000.0
-                            percent = int((current_seconds / total_duration) * 100)
-                            percent = max(0, min(100, percent))
-
-                            current_time = time.time()
-                            if (percent!=last_percent and percent % 5 == 0) or \
-                                (current_time - last_update_time >= min_update_interval):
-                                progress_tracker[res_name]["progress"] = percent
-                                self.update_state(
-                                    state='PROGRESS',
-                                    meta={"tasks":progress_tracker}
-                                )
-                                last_percent = percent
-                                last_update_time = current_time
-
-                    process.wait()
-
-                    if process.returncode != 0:
-                        raise subprocess.CalledProcessError(process.returncode, cmd)
-                    
-                    progress_tracker[res_name]["status"] = "COMPLETED"
-                    progress_tracker[res_name]["progress"] = 100
-
-                    # Uploading finished file to S3
-                    s3_client.upload_file(
-                        output_path,
-                        BUCKET_NAME,
-                        f"output/{output_filename}"
-                    )
-                    logger.info(f"Uploaded {output_filename} to S3")
+            report_progress(job_id, progress_tracker)
+
+            if not remaining:
+                return finish_job(self, db, job_id, progress_tracker)
+
+            # Subtasks stay in the queue the scheduler picked for this job
+            queue = (self.request.delivery_info or {}).get("routing_key")
 
+            if TRANSCODE_MODE == "fanout":
+                # Each rendition becomes its own subtask; the chord callback takes over this task id
+                from worker.tasks.fanout import build_fanout
+                return self.replace(build_fanout(job_id, object_name, total_duration, remaining, queue, predict_fanout_bytes(size, remaining, source_info), plans, completed))
+
+            if TRANSCODE_MODE == "chunked":
+                # Split at keyframes and encode the chunks of every rendition on any worker
+                from worker.tasks.chunked import prepare_chunked
+                return self.replace(prepare_chunked(job_id, workspace, input_path, total_duration, remaining, plans, queue, completed))
+
+            if TRANSCODE_MODE == "single_pass":
+                # The first rendition goes out on its own, so it can be played while the others encode
+                if PROGRESSIVE_FIRST_RENDITION and len(remaining) > 1:
+                    first = next(iter(remaining))
+                    encode_per_rendition(job_id, workspace, input_path, total_duration, progress_tracker, {first: remaining.pop(first)}, plans)
+                try:
+                    encode_single_pass(job_id, workspace, input_path, total_duration, progress_tracker, remaining, plans)
                 except Exception as e:
-                    logger.error(f"Failed processing {res_name}:{e}")
-                    progress_tracker[res_name]["status"] = "FAILED"
-                    progress_tracker[res_name]["error"] = str(e)
-
-                finally:
-                    # Always clean up output temp file, even on failure
-                    try:
-                        if os.path.exists(output_path):
-                            os.remove(output_path)
-                            logger.info(f"Cleaned up temp file: {output_filename}")
-                    except OSError as cleanup_error:
-                        logger.warning(f"Could not clean up temp file {output_filename}: {cleanup_error}")
-
-                    self.update_state(state="PROGRESS",meta={"tasks":progress_tracker})
-            failed_tasks = [res for res,data in progress_tracker.items() if data["status"] == "FAILED"]
-
-            if len(failed_tasks) == len(RESOLUTIONS):
-                logger.error(f"Job {job_id} completely failed.")
-                self.update_state(state="FAILURE",meta={"error":"All resolutions failed to process."})
-
-                job_store.update_job_status(db,job_id,status="FAILED",is_completed=True)
-                raise Exception("All resolutions failed")
-            
-            final_status = "PARTIAL_SUCCESS" if failed_tasks else "COMPLETED"
-            logger.info(f"Job {job_id} finished with status: {final_status}")
-
-            # Database updation
-            db_status = "SUCCESS" if final_status == "COMPLETED" else "FAILED"
-            job_store.update_job_status(db,job_id,status=db_status,is_completed=True)
-
-            return {
-                "status":final_status,
-                "job_id": job_id,
-                "tasks":progress_tracker
-            }
+                    # Keep the per-rendition loop as a fallback if the combined filter graph fails
+                    logger.warning(f"Single-pass encode failed for {job_id}, falling back to per-rendition: {e}")
+                    for res_name in remaining:
+                        progress_tracker[res_name].update({"progress":0,"status":"QUEUED","error":None})
+                    report_progress(job_id, progress_tracker)
+                    encode_per_rendition(job_id, workspace, input_path, total_duration, progress_tracker, remaining, plans)
+            else:
+                encode_per_rendition(job_id, workspace, input_path, total_duration, progress_tracker, remaining, plans)
+
+            return finish_job(self, db, job_id, progress_tracker)
+
+        except (Ignore, Retry) as e:
+            # Raised by self.replace() once the job has been handed over to subtasks, and by self.retry()
+            # when the task is re-queued; neither is a failure of the job
+            retrying = isinstance(e, Retry)
+            raise
 
         except subprocess.CalledProcessError as e:
             logger.error(f"FFmpeg failed with exit code {e.returncode}")
             job_store.update_job_status(db,job_id,status="FAILED",is_completed=True)
+            progress_store.publish_state(job_id, "FAILED")
             raise e  
 
         except Exception as e:
             logger.error(f"Unexpected error in task: {str(e)}")
             job_store.update_job_status(db,job_id,status="FAILED",is_completed=True)
+            progress_store.publish_state(job_id, "FAILED")
             raise e
 
         finally:
-            # Always clean up the input file, regardless of success or failure
-            if local_input_path:
-                try:
-                    if os.path.exists(local_input_path):
-                        os.remove(local_input_path)
-                        logger.info(f"Cleaned up input file: {os.path.basename(local_input_path)}")
-                except OSError as e:
-                    logger.warning(f"Could not clean up input file {local_input_path}: {e}")
\ No newline at end of file
+            # Always remove the workspace (input copy and any leftover outputs), regardless of success or failure.
+            # A retry may run on this node again, so it keeps the downloaded source for a while.
+            if retrying:
+                workspace.retain()
+            else:
+                workspace.teardown()
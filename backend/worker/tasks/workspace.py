@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import socket
+import logging
+import sys
+from contextlib import contextmanager
+from app.core.config import WORKSPACE_ROOT, WORKSPACE_MIN_FREE, WORKSPACE_OUTPUT_RATIO, WORKSPACE_MAX_AGE_HOURS, WORKSPACE_ADMISSION_DELAY, WORKSPACE_ADMISSION_RETRIES, WORKSPACE_RETAIN_SECONDS
+from app.core.metrics import WORKSPACE_DEFERRALS
+from app.core.delivery_store import delivery_store
+from app.services.scheduler import rung_pixels
+from worker.tasks.ffmpeg import STREAM_COPY
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+# Bookkeeping files under WORKSPACE_ROOT (dot names are never workspaces)
+LOCK_FILE = ".admission.lock"
+TRASH_DIR = ".trash"
+RESERVATION_FILE = ".reservation"
+
+
+class InsufficientDiskSpace(Exception):
+    """Admitting a workspace would leave less than WORKSPACE_MIN_FREE on the scratch volume."""
+
+
+class Workspace:
+    """Scratch directory of one task under WORKSPACE_ROOT.
+
+    Everything the task writes lives inside it, so teardown is one rename out of the way followed by a
+    recursive delete, and nothing has to be tracked file by file. The reservation file records the
+    predicted size and the owning process, which admission control and the orphan sweep read.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = os.path.join(WORKSPACE_ROOT, name)
+
+    def file(self, filename: str) -> str:
+        return os.path.join(self.path, filename)
+
+    # Creates the workspace if needed bytes fit on the volume next to what running tasks reserved;
+    # otherwise raises InsufficientDiskSpace (after reclaiming the workspaces of dead tasks)
+    def reserve(self, needed: int = 0):
+        os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+        with _admission_lock():
+            available = _available_bytes(exclude=self.name)
+            if available - needed < WORKSPACE_MIN_FREE and sweep_orphans()[0]:
+                available = _available_bytes(exclude=self.name)
+            if available - needed < WORKSPACE_MIN_FREE:
+                raise InsufficientDiskSpace(
+                    f"Workspace {self.name} needs {needed / 1024**2:.0f} MB, "
+                    f"only {max(available - WORKSPACE_MIN_FREE, 0) / 1024**2:.0f} MB can be reserved"
+                )
+
+            self.create(needed)
+        logger.info(f"Reserved workspace {self.name} ({needed / 1024**2:.0f} MB predicted)")
+        return self
+
+    # Creates the workspace without admission, for space already covered by another task's reservation
+    def create(self, needed: int = 0):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.file(RESERVATION_FILE), "w") as f:
+            json.dump({"bytes": needed, "host": socket.gethostname(), "pid": os.getpid()}, f)
+        return self
+
+    # Keeps the files for a retry of the task (which may reuse the downloaded source) without holding a
+    # reservation; the orphan sweep removes the workspace after WORKSPACE_RETAIN_SECONDS
+    def retain(self):
+        try:
+            with open(self.file(RESERVATION_FILE), "w") as f:
+                json.dump({"bytes": 0, "host": socket.gethostname(), "retained_at": time.time()}, f)
+        except OSError:
+            self.teardown()
+
+    def teardown(self):
+        trash = os.path.join(WORKSPACE_ROOT, TRASH_DIR, f"{self.name}.{os.getpid()}")
+        try:
+            os.makedirs(os.path.dirname(trash), exist_ok=True)
+            os.rename(self.path, trash)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not move workspace {self.name} aside, deleting in place: {e}")
+            trash = self.path
+        shutil.rmtree(trash, ignore_errors=True)
+
+
+# Workspace of the job itself, or of one of its subtasks (scope) so parallel subtasks never share files
+def job_workspace(job_id: str, scope: str = "") -> Workspace:
+    return Workspace(f"{job_id}_{scope}" if scope else job_id)
+
+
+# Reserves a task's workspace or, when it does not fit, re-queues the task so it runs once space is
+# freed here or is picked up by a worker on another node. Raises InsufficientDiskSpace once the task was
+# deferred WORKSPACE_ADMISSION_RETRIES times.
+def reserve_or_defer(task, workspace: Workspace, needed: int = 0) -> Workspace:
+    try:
+        return workspace.reserve(needed)
+    except InsufficientDiskSpace as e:
+        if delivery_store.deferrals(task.request.id) >= WORKSPACE_ADMISSION_RETRIES:
+            raise
+        delivery_store.record_deferral(task.request.id)
+        WORKSPACE_DEFERRALS.labels(task=task.name).inc()
+        logger.warning(f"Deferring {task.name} by {WORKSPACE_ADMISSION_DELAY}s: {e}")
+        # Deferrals have their own budget, so Celery's retry limit never applies to them
+        raise task.retry(exc=e, countdown=WORKSPACE_ADMISSION_DELAY, max_retries=task.request.retries + 1)
+
+
+# Whether the task has retries left for failures. Celery counts deferrals for disk space as retries too,
+# so they are subtracted.
+def failure_retries_left(task) -> bool:
+    return task.request.retries - delivery_store.deferrals(task.request.id) < task.max_retries
+
+
+# Re-queues a task after a failure (check failure_retries_left first)
+def retry_failure(task, exc: Exception, countdown: int = None):
+    return task.retry(exc=exc, countdown=countdown, max_retries=task.request.retries + 1)
+
+
+# Serializes admissions of every worker process sharing the volume
+@contextmanager
+def _admission_lock():
+    with open(os.path.join(WORKSPACE_ROOT, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _workspaces():
+    try:
+        return [entry for entry in os.scandir(WORKSPACE_ROOT) if entry.is_dir() and not entry.name.startswith(".")]
+    except FileNotFoundError:
+        return []
+
+
+def _read_reservation(path: str) -> dict:
+    try:
+        with open(os.path.join(path, RESERVATION_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# Free space minus what admitted workspaces are still predicted to write
+def _available_bytes(exclude: str = None) -> int:
+    outstanding = 0
+    for entry in _workspaces():
+        if entry.name != exclude:
+            reserved = _read_reservation(entry.path).get("bytes", 0)
+            outstanding += max(reserved - _tree_size(entry.path), 0)
+    return shutil.disk_usage(WORKSPACE_ROOT).free - outstanding
+
+
+def _owner_exited(reservation: dict) -> bool:
+    if reservation.get("host") != socket.gethostname() or not reservation.get("pid"):
+        return False
+    try:
+        os.kill(reservation["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+# Removes workspaces left behind by tasks that died without tearing down (the owning process on this host
+# exited, or the workspace is older than max_age seconds), workspaces retained for a retry that did not come
+# back within WORKSPACE_RETAIN_SECONDS, plus anything left in the trash.
+# Returns (workspaces removed, bytes freed).
+def sweep_orphans(max_age: float = WORKSPACE_MAX_AGE_HOURS * 3600):
+    removed = 0
+    freed = 0
+    now = time.time()
+    for entry in _workspaces():
+        try:
+            reservation = _read_reservation(entry.path)
+            expired = reservation.get("retained_at", now) < now - WORKSPACE_RETAIN_SECONDS
+            if not expired and not _owner_exited(reservation) and entry.stat().st_mtime >= now - max_age:
+                continue
+            size = _tree_size(entry.path)
+            Workspace(entry.name).teardown()
+            removed += 1
+            freed += size
+            logger.info(f"Removed orphaned workspace {entry.name} ({size} bytes)")
+        except OSError as e:
+            logger.warning(f"Could not remove workspace {entry.name}: {e}")
+
+    shutil.rmtree(os.path.join(WORKSPACE_ROOT, TRASH_DIR), ignore_errors=True)
+    return removed, freed
+
+
+# Predicted size of every rendition: the source size scaled by the rung's share of the source pixels
+# (a stream-copied rung is the source itself) times WORKSPACE_OUTPUT_RATIO. Without probe data every rung
+# is predicted at the full source size.
+def predict_rendition_bytes(source_size: int, ladder: dict, source_info: dict = None) -> dict:
+    video = (source_info or {}).get("video") or {}
+    width, height = video.get("width"), video.get("height")
+    predictions = {}
+    for res_name, res_scale in ladder.items():
+        share = 1.0
+        if width and height and res_scale != STREAM_COPY:
+            share = rung_pixels(res_name, width, height) / (width * height)
+        predictions[res_name] = int(source_size * share * WORKSPACE_OUTPUT_RATIO)
+    return predictions
+
+
+# Predicted peak usage of a task: the local source copy plus the renditions on disk at the same time
+# (all of them, or the largest when they are written one after another). Packaged renditions also need
+# room for their HLS variant, which is written next to the MP4 one rendition at a time.
+def estimate_bytes(source_size: int, local_input: bool, renditions: list = (), concurrent: bool = False, packaged: bool = False) -> int:
+    needed = source_size if local_input else 0
+    if renditions:
+        needed += sum(renditions) if concurrent else max(renditions)
+        if packaged:
+            needed += max(renditions)
+    return int(needed)
@@ -1,16 +1,58 @@
-import { useQuery } from '@tanstack/react-query';
-import { getTaskStatus } from '../services/api';
-import {useState} from 'react';
+import { useQuery, useQueryClient } from '@tanstack/react-query';
+import { getTaskStatus, getTaskEventsUrl } from '../services/api';
+import {useEffect, useState} from 'react';
+
+// Applies a pushed rendition delta to the cached status response
+function applyProgressEvent(data, event) {
+  if (!data) return data;
+  const { type, res, ...entry } = event;
+  const details = { ...(data.details || {}), [res]: { ...(data.details?.[res] || {}), ...entry } };
+  const values = Object.values(details).map((item) => item.progress || 0);
+  const overall = values.length ? values.reduce((a, b) => a + b, 0) / values.length : 0;
+  return { ...data, state: 'Processing', details, overall_progress: Math.floor(overall) };
+}
 
 export function useTaskStatus({ taskId, enabled = true, onSuccess, onError }) {
 
   const [pollInterval, setPollInterval] = useState(2000)
+  // While the event stream is connected, progress is pushed and polling is switched off
+  const [streaming, setStreaming] = useState(false)
+  const queryClient = useQueryClient();
+
+  useEffect(() => {
+    if (!enabled || !taskId || typeof EventSource === 'undefined') return undefined;
+
+    const source = new EventSource(getTaskEventsUrl(taskId));
+    const queryKey = ['taskStatus', taskId];
+
+    source.addEventListener('snapshot', () => setStreaming(true));
+    source.addEventListener('progress', (message) => {
+      queryClient.setQueryData(queryKey, (data) => applyProgressEvent(data, JSON.parse(message.data)));
+    });
+    source.addEventListener('state', () => {
+      // Final state: one regular status request fetches the download URLs
+      source.close();
+      setStreaming(false);
+      queryClient.invalidateQueries({ queryKey });
+    });
+    source.onerror = () => {
+      // Fall back to polling; the browser would otherwise keep reconnecting
+      source.close();
+      setStreaming(false);
+    };
+
+    return () => {
+      source.close();
+      setStreaming(false);
+    };
+  }, [taskId, enabled, queryClient]);
 
   return useQuery({
     queryKey: ['taskStatus', taskId],
     queryFn: () => getTaskStatus(taskId),
     enabled: enabled && !!taskId,
     refetchInterval: (data) => {
+      if (streaming) return false;
       const state = String(data?.state || '').toUpperCase();
       // Stop polling if task is complete or failed
       if (
@@ -31,4 +73,4 @@ export function useTaskStatus({ taskId, enabled = true, onSuccess, onError }) {
     onSuccess,
     onError,
   });
-}
+}
\ No newline at end of file
@@ -43,7 +43,7 @@ api.interceptors.response.use(
       if (status === 429) {
         errorMessage = 'Rate limit exceeded. Please wait a moment.';
       } else if (status === 413) {
-        errorMessage = 'File too large. Maximum size is 2MB.';
+        errorMessage = 'File too large.';
       } else if (status === 500) {
         errorMessage = 'Server error. Please try again later.';
       }
@@ -59,11 +59,27 @@ api.interceptors.response.use(
   }
 );
 
+// Files above this size are sent as a multipart upload with parallel part PUTs
+const MULTIPART_THRESHOLD = 32 * 1024 * 1024;
+const PART_CONCURRENCY = 4;
+const PART_RETRIES = 3;
+
 /**
  * Upload video to S3 via presigned URL
  * Flow: 1) Get presigned URL from backend → 2) Upload directly to S3 → 3) Start processing
  */
 export const uploadVideo = async (file, onProgress) => {
+  const task_id = file.size > MULTIPART_THRESHOLD
+    ? await uploadMultipart(file, onProgress)
+    : await uploadSinglePut(file, onProgress);
+
+  // Notify backend that upload is complete and start transcoding
+  await api.post(`/process/${task_id}`);
+
+  return { task_id };
+};
+
+const uploadSinglePut = async (file, onProgress) => {
   // Step 1: Request presigned upload URL from backend
   const initResponse = await api.post('/upload', {
     filename: file.name,
@@ -90,10 +106,75 @@ export const uploadVideo = async (file, onProgress) => {
     },
   });
 
-  // Step 3: Notify backend that upload is complete and start transcoding
-  await api.post(`/process/${task_id}`);
+  return task_id;
+};
 
-  return { task_id };
+/**
+ * Multipart upload: parts are PUT to S3 concurrently and each part retries on its own.
+ * A failed upload is aborted, so a new attempt starts over with a new upload.
+ */
+const uploadMultipart = async (file, onProgress) => {
+  const initResponse = await api.post('/upload/multipart/initiate', {
+    filename: file.name,
+    filesize: file.size
+  });
+  const { task_id, upload_id, part_size, part_count } = initResponse.data;
+
+  try {
+    const completed = new Map();
+    const pending = Array.from({ length: part_count }, (_, i) => i + 1);
+
+    const loaded = new Map();
+    const reportProgress = () => {
+      if (!onProgress) return;
+      let bytes = 0;
+      completed.forEach((_, partNumber) => { bytes += Math.min(part_size, file.size - (partNumber - 1) * part_size); });
+      loaded.forEach((value) => { bytes += value; });
+      onProgress(Math.round((bytes * 100) / file.size));
+    };
+
+    const signResponse = await api.post(`/upload/multipart/${task_id}/sign`, { upload_id, part_numbers: pending });
+    const urls = signResponse.data.urls;
+
+    const uploadPart = async (partNumber) => {
+      const blob = file.slice((partNumber - 1) * part_size, partNumber * part_size);
+      for (let attempt = 1; ; attempt++) {
+        try {
+          const response = await axios.put(urls[partNumber], blob, {
+            onUploadProgress: (progressEvent) => {
+              loaded.set(partNumber, progressEvent.loaded);
+              reportProgress();
+            },
+          });
+          loaded.delete(partNumber);
+          // S3 must expose the ETag header through CORS (see cors.json)
+          completed.set(partNumber, response.headers.etag);
+          reportProgress();
+          return;
+        } catch (error) {
+          loaded.delete(partNumber);
+          if (attempt >= PART_RETRIES) throw error;
+          await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt));
+        }
+      }
+    };
+
+    // A small pool of workers pulling part numbers off the queue
+    const queue = [...pending];
+    const workers = Array.from({ length: Math.min(PART_CONCURRENCY, queue.length) }, async () => {
+      while (queue.length) {
+        await uploadPart(queue.shift());
+      }
+    });
+    await Promise.all(workers);
+
+    const parts = [...completed.entries()].map(([part_number, etag]) => ({ part_number, etag }));
+    await api.post(`/upload/multipart/${task_id}/complete`, { upload_id, parts });
+    return task_id;
+  } catch (error) {
+    await api.post(`/upload/multipart/${task_id}/abort`, { upload_id }).catch(() => {});
+    throw error;
+  }
 };
 
 export const getTaskStatus = async (taskId) => {
@@ -101,6 +182,9 @@ export const getTaskStatus = async (taskId) => {
   return response.data;
 };
 
+// Server-Sent Events endpoint that pushes progress changes (EventSource needs an absolute or same-origin URL)
+export const getTaskEventsUrl = (taskId) => `${api.defaults.baseURL}/tasks/${taskId}/events`;
+
 export const cancelTask = async (taskId) => {
   await api.post(`/tasks/${taskId}/cancel`);
 };
@@ -18,4 +18,4 @@ export const RESOLUTIONS = [
 // File validation constants
 export const ALLOWED_FILE_TYPES = ['video/mp4', 'video/x-matroska', 'video/quicktime'];
 export const ALLOWED_EXTENSIONS = ['.mp4', '.mkv', '.mov'];
-export const MAX_FILE_SIZE = 2 * 1024 * 1024; // 2MB
+export const MAX_FILE_SIZE = Number(import.meta.env.VITE_MAX_UPLOAD_SIZE_MB || 2048) * 1024 * 1024; // Must match MAX_UPLOAD_SIZE_MB on the backend